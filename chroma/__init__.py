@@ -3,6 +3,7 @@
 """
 
 from .chroma_client import ChromaDBClient
+from .onnx_embedding import ONNXEmbeddingFunction
 
-__all__ = ['ChromaDBClient']
+__all__ = ['ChromaDBClient', 'ONNXEmbeddingFunction']
 
@@ -8,12 +8,36 @@ ChromaDB - это векторная база данных для хранени
 3. Хранить метаданные вместе с текстом
 """
 
+import asyncio
 import chromadb
+from chromadb.api.types import EmbeddingFunction
 from chromadb.config import Settings
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 import openai
 import os
 
+from embeddings import EmbeddingCache, create_embeddings
+
+
+# Модель OpenAI для создания эмбеддингов
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Режимы работы клиента:
+# - local: ChromaDB внутри процесса (данные в persist_directory)
+# - http:  отдельный сервер ChromaDB (`chroma run --path ./chroma_db`), запись
+#          в SQLite идет в процессе сервера и не блокирует создание эмбеддингов
+CLIENT_MODES = ('local', 'http')
+
+# PRAGMA для массовой загрузки: без журнала и fsync, временные данные в памяти,
+# блокировка файла базы удерживается между транзакциями
+FAST_INGEST_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "locking_mode": "EXCLUSIVE",
+}
+
 
 class ChromaDBClient:
     """
@@ -24,7 +48,19 @@ class ChromaDBClient:
     def __init__(
         self, 
         persist_directory: str = "./chroma_db",
-        collection_name: str = "documents"
+        collection_name: str = "documents",
+        embedding_dim: int = 512,
+        use_embedding_cache: bool = True,
+        embed_concurrency: int = 8,
+        batch_size: int = 128,
+        embedding_function: Optional[EmbeddingFunction] = None,
+        hnsw_space: str = "cosine",
+        hnsw_m: int = 16,
+        hnsw_construction_ef: int = 100,
+        hnsw_search_ef: int = 64,
+        client_mode: str = "local",
+        host: str = "localhost",
+        port: int = 8000
     ):
         """
         Инициализирует клиент ChromaDB.
@@ -32,21 +68,82 @@ class ChromaDBClient:
         Args:
             persist_directory: Директория для хранения данных ChromaDB
             collection_name: Имя коллекции для хранения документов
+            embedding_dim: Размерность OpenAI эмбеддингов (text-embedding-3
+                           возвращает укороченные векторы через параметр dimensions)
+            use_embedding_cache: Кэшировать OpenAI эмбеддинги на диске, чтобы
+                                 не отправлять один и тот же текст повторно
+            embed_concurrency: Максимальное число одновременных запросов
+                               к OpenAI при создании эмбеддингов
+            batch_size: Количество документов в одном вызове collection.add
+                        (каждый вызов - отдельная транзакция SQLite)
+            embedding_function: Функция эмбеддингов коллекции (например,
+                                ONNXEmbeddingFunction). Если None, используется
+                                встроенная функция ChromaDB
+            hnsw_space: Метрика HNSW индекса коллекции ('cosine', 'l2', 'ip').
+                        Эмбеддинги OpenAI сравниваются по косинусу, и с 'cosine'
+                        их не нужно нормализовать заранее
+            hnsw_m: Число связей вершины в графе HNSW (больше - выше полнота,
+                    но больше памяти и медленнее построение)
+            hnsw_construction_ef: Ширина поиска при построении графа
+            hnsw_search_ef: Ширина поиска при запросе (баланс скорости и полноты)
+            client_mode: 'local' - ChromaDB в текущем процессе,
+                         'http' - подключение к запущенному серверу ChromaDB
+            host: Адрес сервера ChromaDB (для client_mode='http')
+            port: Порт сервера ChromaDB (для client_mode='http')
+            
+        Параметры HNSW задаются при создании коллекции; у уже существующей
+        коллекции ChromaDB сохраняет те, с которыми она была создана.
         """
+        if client_mode not in CLIENT_MODES:
+            raise ValueError(
+                f"Неизвестный режим клиента: {client_mode}. "
+                f"Допустимые значения: {', '.join(CLIENT_MODES)}"
+            )
+        
         self.persist_directory = persist_directory
         self.collection_name = collection_name
+        self.client_mode = client_mode
+        self.host = host
+        self.port = port
+        self.embedding_dim = embedding_dim
+        self.batch_size = batch_size
+        self.embedding_function = embedding_function
+        self.hnsw_metadata = {
+            "hnsw:space": hnsw_space,
+            "hnsw:M": hnsw_m,
+            "hnsw:construction_ef": hnsw_construction_ef,
+            "hnsw:search_ef": hnsw_search_ef,
+        }
         
         # Инициализируем ChromaDB клиент
-        # persist_directory означает, что данные будут сохраняться на диск
-        self.client = chromadb.Client(Settings(
-            persist_directory=persist_directory,
-            anonymized_telemetry=False  # Отключаем телеметрию
-        ))
+        if client_mode == "http":
+            self.client = chromadb.HttpClient(
+                host=host,
+                port=port,
+                settings=Settings(anonymized_telemetry=False)
+            )
+        else:
+            # persist_directory означает, что данные будут сохраняться на диск
+            self.client = chromadb.Client(Settings(
+                persist_directory=persist_directory,
+                anonymized_telemetry=False  # Отключаем телеметрию
+            ))
+        # Асинхронная коллекция создается при первом вызове async-методов
+        self._async_collection = None
         
-        # Получаем или создаем коллекцию
-        self.collection = None
+        # Кэш OpenAI эмбеддингов хранится рядом с данными ChromaDB
+        self.embed_concurrency = embed_concurrency
+        self.embedding_cache = None
+        if use_embedding_cache:
+            self.embedding_cache = EmbeddingCache(
+                os.path.join(persist_directory, "embeddings_cache.db")
+            )
         
         print(f"ChromaDB инициализирован. Директория: {persist_directory}")
+        
+        # Коллекция открывается один раз: get_or_create_collection читает
+        # метаданные из SQLite, и повторять это на каждый запрос незачем
+        self.collection = self.get_or_create_collection()
     
     def get_or_create_collection(self) -> chromadb.Collection:
         """
@@ -58,23 +155,115 @@ class ChromaDBClient:
         try:
             # Пытаемся получить существующую коллекцию
             self.collection = self.client.get_or_create_collection(
-                name=self.collection_name,
-                metadata={"description": "RAG документы для демонстрации"}
+                **self._collection_kwargs()
             )
             print(f"Коллекция '{self.collection_name}' готова к использованию")
             return self.collection
         except Exception as e:
             raise Exception(f"Ошибка при создании коллекции: {str(e)}")
     
+    def _collection_kwargs(self) -> Dict:
+        """Параметры коллекции, общие для синхронного и асинхронного клиентов."""
+        kwargs = {
+            "name": self.collection_name,
+            "metadata": {
+                "description": "RAG документы для демонстрации",
+                **self.hnsw_metadata
+            }
+        }
+        if self.embedding_function is not None:
+            kwargs["embedding_function"] = self.embedding_function
+        return kwargs
+    
+    async def _get_async_collection(self):
+        """
+        Возвращает коллекцию через chromadb.AsyncHttpClient (только client_mode='http').
+        
+        Returns:
+            Асинхронный объект коллекции ChromaDB
+        """
+        if self.client_mode != "http":
+            raise ValueError("Асинхронные методы доступны только при client_mode='http'")
+        
+        if self._async_collection is None:
+            client = await chromadb.AsyncHttpClient(
+                host=self.host,
+                port=self.port,
+                settings=Settings(anonymized_telemetry=False)
+            )
+            self._async_collection = await client.get_or_create_collection(
+                **self._collection_kwargs()
+            )
+        return self._async_collection
+    
+    def _get_sqlite_connection(self):
+        """
+        Возвращает sqlite3-соединение, через которое ChromaDB пишет данные.
+        
+        ChromaDB не предоставляет публичного API для этого, поэтому используются
+        внутренние объекты. Если их структура изменилась, возвращается None.
+        
+        Returns:
+            Соединение sqlite3 или None
+        """
+        try:
+            from chromadb.db.impl.sqlite import SqliteDB
+            
+            db = self.client._system.instance(SqliteDB)
+            conn = db._conn_pool.connect()
+            # Пул ChromaDB возвращает обертку над sqlite3.Connection
+            return getattr(conn, "_conn", conn)
+        except Exception:
+            return None
+    
+    @contextmanager
+    def fast_ingest(self):
+        """
+        Контекстный менеджер для ускоренной массовой загрузки документов.
+        
+        Внутри блока SQLite работает без журнала и без fsync, поэтому сбой
+        во время загрузки может повредить базу. При выходе из блока прежние
+        настройки восстанавливаются, так что риск ограничен временем загрузки.
+        
+        Пример:
+            with client.fast_ingest():
+                client.add_documents_with_openai_embeddings(texts, metadatas)
+        """
+        conn = self._get_sqlite_connection()
+        if conn is None:
+            print("⚠️  Не удалось получить соединение SQLite, загрузка без оптимизаций")
+            yield self
+            return
+        
+        previous = {
+            name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in FAST_INGEST_PRAGMAS
+        }
+        for name, value in FAST_INGEST_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        
+        try:
+            yield self
+        finally:
+            for name in reversed(list(previous)):
+                conn.execute(f"PRAGMA {name}={previous[name]}")
+            # После возврата в locking_mode=NORMAL эксклюзивная блокировка
+            # снимается только при следующем обращении к базе
+            conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+    
     def delete_collection(self):
         """
         Удаляет коллекцию (полезно для очистки данных).
+        
+        Вместо удаленной сразу создается пустая коллекция с тем же именем,
+        чтобы клиентом можно было продолжать пользоваться.
         """
         try:
             self.client.delete_collection(name=self.collection_name)
             print(f"Коллекция '{self.collection_name}' удалена")
         except Exception as e:
             print(f"Ошибка при удалении коллекции: {str(e)}")
+        self.collection = self.get_or_create_collection()
     
     def add_documents(
         self,
@@ -92,9 +281,6 @@ class ChromaDBClient:
             metadatas: Список метаданных для каждого чанка
             ids: Список уникальных идентификаторов (если None, генерируются автоматически)
         """
-        if not self.collection:
-            self.get_or_create_collection()
-        
         # Генерируем ID, если они не предоставлены
         if ids is None:
             ids = [f"doc_{i}" for i in range(len(texts))]
@@ -102,11 +288,7 @@ class ChromaDBClient:
         try:
             # Добавляем документы в коллекцию
             # ChromaDB автоматически создаст эмбеддинги с помощью встроенной модели
-            self.collection.add(
-                documents=texts,
-                metadatas=metadatas,
-                ids=ids
-            )
+            self._add_in_batches(texts, metadatas, ids)
             print(f"Добавлено {len(texts)} документов в коллекцию")
         except Exception as e:
             raise Exception(f"Ошибка при добавлении документов: {str(e)}")
@@ -127,9 +309,6 @@ class ChromaDBClient:
             ids: Список ID
             openai_api_key: API ключ OpenAI (если None, берется из переменной окружения)
         """
-        if not self.collection:
-            self.get_or_create_collection()
-        
         # Настраиваем OpenAI API
         if openai_api_key:
             openai.api_key = openai_api_key
@@ -152,51 +331,124 @@ class ChromaDBClient:
             embeddings = self._create_openai_embeddings(texts)
             
             # Добавляем документы с эмбеддингами
-            self.collection.add(
-                documents=texts,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=ids
+            self._add_in_batches(texts, metadatas, ids, embeddings)
+            print(f"Добавлено {len(texts)} документов с OpenAI эмбеддингами")
+        except Exception as e:
+            raise Exception(f"Ошибка при создании эмбеддингов: {str(e)}")
+    
+    async def aadd_documents_with_openai_embeddings(
+        self,
+        texts: List[str],
+        metadatas: List[Dict],
+        ids: Optional[List[str]] = None,
+        openai_api_key: Optional[str] = None
+    ):
+        """
+        Асинхронно добавляет документы с эмбеддингами от OpenAI на сервер ChromaDB.
+        
+        Пока сервер записывает очередной батч, для следующего батча уже
+        создаются эмбеддинги, так что сеть OpenAI и запись в базу перекрываются.
+        Требует client_mode='http'.
+        
+        Args:
+            texts: Список текстовых чанков
+            metadatas: Список метаданных
+            ids: Список ID
+            openai_api_key: API ключ OpenAI (если None, берется из переменной окружения)
+        """
+        # Настраиваем OpenAI API
+        if openai_api_key:
+            openai.api_key = openai_api_key
+        elif os.getenv("OPENAI_API_KEY"):
+            openai.api_key = os.getenv("OPENAI_API_KEY")
+        else:
+            raise ValueError(
+                "OpenAI API key не найден. "
+                "Установите переменную окружения OPENAI_API_KEY "
+                "или передайте ключ явно"
             )
+        
+        # Генерируем ID, если они не предоставлены
+        if ids is None:
+            ids = [f"doc_{i}" for i in range(len(texts))]
+        
+        collection = await self._get_async_collection()
+        
+        try:
+            pending = None
+            for start in range(0, len(texts), self.batch_size):
+                end = start + self.batch_size
+                # Эмбеддинги создаются в отдельном потоке, чтобы не блокировать
+                # event loop, пока сервер записывает предыдущий батч
+                embeddings = await asyncio.to_thread(
+                    self._create_openai_embeddings, texts[start:end]
+                )
+                if pending is not None:
+                    await pending
+                pending = asyncio.create_task(collection.add(
+                    documents=texts[start:end],
+                    embeddings=embeddings,
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                ))
+            if pending is not None:
+                await pending
             print(f"Добавлено {len(texts)} документов с OpenAI эмбеддингами")
         except Exception as e:
             raise Exception(f"Ошибка при создании эмбеддингов: {str(e)}")
     
+    def _add_in_batches(
+        self,
+        texts: List[str],
+        metadatas: List[Dict],
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None
+    ):
+        """
+        Добавляет документы в коллекцию батчами по batch_size.
+        
+        Один огромный вызов add упирается в лимит батча ChromaDB, а вызовы
+        по одному документу тратят время на накладные расходы транзакций.
+        
+        Args:
+            texts: Список текстовых чанков
+            metadatas: Список метаданных
+            ids: Список ID
+            embeddings: Готовые эмбеддинги (если None, их создаст ChromaDB)
+        """
+        total = len(texts)
+        for start in range(0, total, self.batch_size):
+            end = start + self.batch_size
+            self.collection.add(
+                documents=texts[start:end],
+                embeddings=embeddings[start:end] if embeddings is not None else None,
+                metadatas=metadatas[start:end],
+                ids=ids[start:end]
+            )
+            if total > self.batch_size:
+                print(f"Записано {min(end, total)}/{total} документов...")
+    
     def _create_openai_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
         Создает эмбеддинги с помощью OpenAI API.
         
+        Тексты, уже найденные в кэше, в API не отправляются, а батчи
+        отправляются конкурентно (не более embed_concurrency одновременно).
+        
         Args:
             texts: Список текстов
             
         Returns:
             Список векторов эмбеддингов
         """
-        embeddings = []
-        
-        # Обрабатываем тексты батчами для эффективности
-        batch_size = 100
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            
-            try:
-                # Используем модель text-embedding-ada-002 (или text-embedding-3-small для более новой версии)
-                response = openai.embeddings.create(
-                    input=batch,
-                    model="text-embedding-3-small"  # Или "text-embedding-ada-002"
-                )
-                
-                # Извлекаем эмбеддинги из ответа
-                batch_embeddings = [item.embedding for item in response.data]
-                embeddings.extend(batch_embeddings)
-                
-                print(f"Обработано {len(embeddings)}/{len(texts)} текстов...")
-                
-            except Exception as e:
-                print(f"Ошибка при создании эмбеддингов для батча: {str(e)}")
-                raise
-        
-        return embeddings
+        embeddings = create_embeddings(
+            texts,
+            model=EMBEDDING_MODEL,
+            dimensions=self.embedding_dim,
+            cache=self.embedding_cache,
+            concurrency=self.embed_concurrency
+        )
+        return embeddings.tolist()
     
     def search(
         self,
@@ -215,9 +467,6 @@ class ChromaDBClient:
         Returns:
             Словарь с результатами поиска
         """
-        if not self.collection:
-            self.get_or_create_collection()
-        
         try:
             # Выполняем поиск
             # ChromaDB автоматически создаст эмбеддинг для запроса
@@ -250,9 +499,6 @@ class ChromaDBClient:
         Returns:
             Словарь с результатами
         """
-        if not self.collection:
-            self.get_or_create_collection()
-        
         # Настраиваем OpenAI API
         if openai_api_key:
             openai.api_key = openai_api_key
@@ -276,6 +522,47 @@ class ChromaDBClient:
         except Exception as e:
             raise Exception(f"Ошибка при поиске: {str(e)}")
     
+    async def asearch_with_openai_embedding(
+        self,
+        query: str,
+        n_results: int = 5,
+        where: Optional[Dict] = None,
+        openai_api_key: Optional[str] = None
+    ) -> Dict:
+        """
+        Асинхронно выполняет поиск с эмбеддингом от OpenAI (client_mode='http').
+        
+        Args:
+            query: Поисковый запрос
+            n_results: Количество результатов
+            where: Фильтр метаданных
+            openai_api_key: API ключ OpenAI
+            
+        Returns:
+            Словарь с результатами
+        """
+        # Настраиваем OpenAI API
+        if openai_api_key:
+            openai.api_key = openai_api_key
+        elif os.getenv("OPENAI_API_KEY"):
+            openai.api_key = os.getenv("OPENAI_API_KEY")
+        else:
+            raise ValueError("OpenAI API key не найден")
+        
+        collection = await self._get_async_collection()
+        
+        try:
+            query_embedding = (await asyncio.to_thread(
+                self._create_openai_embeddings, [query]
+            ))[0]
+            return await collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where
+            )
+        except Exception as e:
+            raise Exception(f"Ошибка при поиске: {str(e)}")
+    
     def get_collection_stats(self) -> Dict:
         """
         Получает статистику коллекции.
@@ -283,9 +570,6 @@ class ChromaDBClient:
         Returns:
             Словарь со статистикой
         """
-        if not self.collection:
-            self.get_or_create_collection()
-        
         try:
             count = self.collection.count()
             return {
@@ -306,9 +590,6 @@ if __name__ == "__main__":
         collection_name="test_collection"
     )
     
-    # Создаем коллекцию
-    client.get_or_create_collection()
-    
     # Пример данных
     sample_texts = [
         "Python - это высокоуровневый язык программирования.",
@@ -0,0 +1,126 @@
+"""
+Локальная функция эмбеддингов для ChromaDB на ONNX Runtime.
+
+Встроенная функция ChromaDB считает эмбеддинги через sentence-transformers
+на CPU, и при загрузке больших коллекций это занимает основное время.
+Здесь используется экспортированная в ONNX модель (например, bge-small-en-v1.5),
+веса которой квантуются в INT8, а вычисления выполняются на GPU, если он есть.
+
+Ожидаемая структура директории модели:
+    model_dir/
+        model.onnx       - модель, экспортированная в ONNX
+        tokenizer.json   - токенизатор HuggingFace
+"""
+
+import os
+from typing import List
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+
+# Провайдеры ONNX Runtime в порядке предпочтения
+PREFERRED_PROVIDERS = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+
+
+class ONNXEmbeddingFunction(EmbeddingFunction):
+    """
+    Функция эмбеддингов ChromaDB на основе ONNX модели с INT8 весами.
+    """
+    
+    def __init__(
+        self,
+        model_dir: str,
+        quantize: bool = True,
+        max_length: int = 512,
+        batch_size: int = 32
+    ):
+        """
+        Загружает токенизатор и модель.
+        
+        Args:
+            model_dir: Директория с model.onnx и tokenizer.json
+            quantize: Квантовать веса модели в INT8 (результат кэшируется
+                      рядом с моделью в model.int8.onnx)
+            max_length: Максимальная длина текста в токенах
+            batch_size: Количество текстов в одном прогоне модели
+        """
+        # Зависимости опциональны и нужны только при использовании этого класса
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        model_path = os.path.join(model_dir, "model.onnx")
+        if quantize:
+            model_path = self._quantize(model_path)
+        
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+        
+        available = ort.get_available_providers()
+        providers = [p for p in PREFERRED_PROVIDERS if p in available]
+        self.session = ort.InferenceSession(model_path, providers=providers)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        
+        print(f"ONNX модель загружена: {model_path} ({self.session.get_providers()[0]})")
+    
+    @staticmethod
+    def _quantize(model_path: str) -> str:
+        """
+        Квантует веса модели в INT8, если это еще не сделано.
+        
+        Args:
+            model_path: Путь к исходной ONNX модели
+            
+        Returns:
+            Путь к квантованной модели
+        """
+        quantized_path = model_path.replace(".onnx", ".int8.onnx")
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            
+            print("Квантование модели в INT8...")
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+    
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Прогоняет один батч текстов через модель.
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            Нормализованные эмбеддинги, shape (len(texts), dim)
+        """
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        # Передаем только те входы, которые есть у конкретной модели
+        inputs = {name: value for name, value in inputs.items() if name in self.input_names}
+        
+        last_hidden_state = self.session.run(None, inputs)[0]
+        
+        # Модели bge используют эмбеддинг [CLS] токена с L2-нормализацией
+        embeddings = last_hidden_state[:, 0]
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    
+    def __call__(self, input: Documents) -> Embeddings:
+        """
+        Создает эмбеддинги для списка текстов.
+        
+        Args:
+            input: Список текстов
+            
+        Returns:
+            Список векторов эмбеддингов
+        """
+        embeddings = []
+        for start in range(0, len(input), self.batch_size):
+            batch = self._embed_batch(list(input[start:start + self.batch_size]))
+            embeddings.extend(batch.tolist())
+        return embeddings
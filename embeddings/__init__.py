@@ -0,0 +1,16 @@
+"""
+Пакет embeddings содержит общие инструменты для работы с эмбеддингами.
+"""
+
+from .cache import EmbeddingCache
+from .openai_embedder import create_embeddings, embed_batches_async
+from .query_cache import SemanticQueryCache, cached_search, cached_search_batch
+
+__all__ = [
+    'EmbeddingCache',
+    'create_embeddings',
+    'embed_batches_async',
+    'SemanticQueryCache',
+    'cached_search',
+    'cached_search_batch'
+]
@@ -0,0 +1,104 @@
+"""
+Кэш эмбеддингов на диске.
+
+Создание эмбеддинга - это HTTP-запрос к OpenAI, который стоит времени и денег.
+Один и тот же текст (повторная загрузка документов, одинаковые запросы)
+не нужно отправлять в API повторно: вектор берется из кэша.
+
+Ключ кэша - хеш от (модель, размерность, текст), поэтому смена модели
+или размерности не приводит к использованию чужих векторов.
+"""
+
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+
+# Ограничение на число параметров в одном SQL-запросе (у старых SQLite - 999)
+SQLITE_MAX_VARS = 900
+
+
+class EmbeddingCache:
+    """
+    Хранилище эмбеддингов в SQLite: blake2b(модель, размерность, текст) -> float32 байты.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Открывает (или создает) файл кэша.
+        
+        Args:
+            path: Путь к файлу SQLite
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._db.commit()
+    
+    @staticmethod
+    def _key(text: str, model: str, dimensions: int) -> bytes:
+        data = f"{model}\x00{dimensions}\x00{text}".encode('utf-8')
+        return hashlib.blake2b(data, digest_size=16).digest()
+    
+    def get_many(
+        self,
+        texts: List[str],
+        model: str,
+        dimensions: int
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Ищет эмбеддинги текстов в кэше.
+        
+        Args:
+            texts: Список текстов
+            model: Имя модели эмбеддингов
+            dimensions: Размерность эмбеддингов
+            
+        Returns:
+            Список той же длины: вектор для найденных текстов, None для остальных
+        """
+        keys = [self._key(text, model, dimensions) for text in texts]
+        found = {}
+        for i in range(0, len(keys), SQLITE_MAX_VARS):
+            batch = keys[i:i + SQLITE_MAX_VARS]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype='float32')
+        return [found.get(key) for key in keys]
+    
+    def put_many(
+        self,
+        texts: List[str],
+        vectors: List,
+        model: str,
+        dimensions: int
+    ):
+        """
+        Сохраняет эмбеддинги в кэш одной транзакцией.
+        
+        Args:
+            texts: Список текстов
+            vectors: Эмбеддинги этих текстов (в том же порядке)
+            model: Имя модели эмбеддингов
+            dimensions: Размерность эмбеддингов
+        """
+        rows = [
+            (self._key(text, model, dimensions), np.asarray(vector, dtype='float32').tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+            )
+    
+    def close(self):
+        self._db.close()
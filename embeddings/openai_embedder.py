@@ -0,0 +1,166 @@
+"""
+Создание эмбеддингов через OpenAI API.
+
+Тексты отправляются батчами. Если батчей несколько, запросы выполняются
+конкурентно через AsyncOpenAI: время ожидания равно нескольким самым
+медленным запросам, а не сумме всех сетевых задержек.
+
+Пакет openai импортируется при первом обращении к API: его загрузка
+занимает заметную часть запуска, а запросы из кэша обходятся без него.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from .cache import EmbeddingCache
+
+
+async def embed_batches_async(
+    batches: List[List[str]],
+    model: str,
+    dimensions: int,
+    concurrency: int = 8
+) -> List[np.ndarray]:
+    """
+    Конкурентно создает эмбеддинги для нескольких батчей текстов.
+    
+    Args:
+        batches: Список батчей текстов
+        model: Имя модели эмбеддингов
+        dimensions: Размерность эмбеддингов
+        concurrency: Максимальное число одновременных запросов к API
+        
+    Returns:
+        Массивы эмбеддингов (float32) для каждого батча в исходном порядке
+    """
+    import openai
+    
+    client = openai.AsyncOpenAI(api_key=openai.api_key)
+    semaphore = asyncio.Semaphore(concurrency)
+    total = sum(len(batch) for batch in batches)
+    done = 0
+    
+    async def embed(batch: List[str]) -> np.ndarray:
+        nonlocal done
+        async with semaphore:
+            response = await client.embeddings.create(
+                input=batch,
+                model=model,
+                dimensions=dimensions
+            )
+        done += len(batch)
+        print(f"Обработано {done}/{total} текстов...")
+        return np.asarray([item.embedding for item in response.data], dtype='float32')
+    
+    try:
+        # gather возвращает результаты в порядке батчей, а не завершения запросов
+        return await asyncio.gather(*(embed(batch) for batch in batches))
+    finally:
+        await client.close()
+
+
+def _run(coro):
+    """Выполняет корутину из синхронного кода, даже если event loop уже запущен."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    
+    # asyncio.run нельзя вызвать внутри работающего event loop,
+    # поэтому запускаем отдельный loop во вспомогательном потоке
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def create_embeddings(
+    texts: List[str],
+    model: str,
+    dimensions: int,
+    cache: Optional[EmbeddingCache] = None,
+    batch_size: int = 100,
+    concurrency: int = 8
+) -> np.ndarray:
+    """
+    Создает эмбеддинги текстов, используя кэш и конкурентные запросы.
+    
+    Args:
+        texts: Список текстов
+        model: Имя модели эмбеддингов
+        dimensions: Размерность эмбеддингов
+        cache: Кэш эмбеддингов (None - без кэша)
+        batch_size: Количество текстов в одном запросе к API
+        concurrency: Максимальное число одновременных запросов к API
+        
+    Returns:
+        Массив эмбеддингов float32 формы (len(texts), dimensions)
+        в порядке текстов
+    """
+    # Повторяющиеся тексты (колонтитулы, шаблонные блоки) отправляются
+    # в API один раз, а результат раздается всем их вхождениям
+    unique_texts = list(dict.fromkeys(texts))
+    if len(unique_texts) < len(texts):
+        print(f"Повторяющихся текстов: {len(texts) - len(unique_texts)}")
+        unique_embeddings = create_embeddings(
+            unique_texts, model, dimensions, cache, batch_size, concurrency
+        )
+        position = {text: i for i, text in enumerate(unique_texts)}
+        return unique_embeddings[[position[text] for text in texts]]
+    
+    # Результат заполняется на месте, без промежуточного списка списков
+    embeddings = np.empty((len(texts), dimensions), dtype='float32')
+    
+    misses = list(range(len(texts)))
+    if cache is not None:
+        cached = cache.get_many(texts, model, dimensions)
+        misses = []
+        for i, embedding in enumerate(cached):
+            if embedding is None:
+                misses.append(i)
+            else:
+                embeddings[i] = embedding
+    
+    if len(misses) < len(texts):
+        print(f"Найдено в кэше: {len(texts) - len(misses)}/{len(texts)} текстов")
+    if not misses:
+        return embeddings
+    
+    miss_texts = [texts[i] for i in misses]
+    batches = [
+        miss_texts[i:i + batch_size]
+        for i in range(0, len(miss_texts), batch_size)
+    ]
+    
+    import openai
+    
+    try:
+        if len(batches) == 1:
+            # Один батч (например, поисковый запрос) - обходимся без event loop
+            response = openai.embeddings.create(
+                input=batches[0],
+                model=model,
+                dimensions=dimensions
+            )
+            batch_results = [
+                np.asarray([item.embedding for item in response.data], dtype='float32')
+            ]
+            print(f"Обработано {len(miss_texts)}/{len(miss_texts)} текстов...")
+        else:
+            batch_results = _run(
+                embed_batches_async(batches, model, dimensions, concurrency)
+            )
+    except Exception as e:
+        print(f"Ошибка при создании эмбеддингов: {str(e)}")
+        raise
+    
+    miss_positions = np.array(misses)
+    start = 0
+    for batch, batch_embeddings in zip(batches, batch_results):
+        embeddings[miss_positions[start:start + len(batch)]] = batch_embeddings
+        if cache is not None:
+            cache.put_many(batch, batch_embeddings, model, dimensions)
+        start += len(batch)
+    
+    return embeddings
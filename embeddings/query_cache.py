@@ -0,0 +1,544 @@
+"""
+Семантический кэш результатов поиска.
+
+Пользователи часто задают один и тот же вопрос разными словами. Если эмбеддинг
+нового запроса почти совпадает (косинусное сходство >= tau) с эмбеддингом
+уже выполненного, то и результаты поиска будут теми же: они берутся из кэша
+без обращения к индексу. Дословный повтор запроса находится еще раньше -
+по SHA-256 текста, без создания эмбеддинга.
+
+Кэш хранится в памяти как матрица нормализованных эмбеддингов, квантованных
+в int8 с масштабом на строку (в 4 раза меньше памяти, чем float32), поиск
+по нему - одно умножение матрицы на вектор. Между запусками кэш сохраняется
+в сжатый .npz файл (автоматически при выходе из интерпретатора) вместе
+с "версией" индекса: после переиндексации старые результаты отбрасываются,
+как и записи старше TTL.
+"""
+
+import atexit
+import functools
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# Порог косинусного сходства, начиная с которого запросы считаются одинаковыми
+QUERY_CACHE_TAU = 0.95
+
+# Время жизни записи кэша в секундах (None - без ограничения)
+QUERY_CACHE_TTL = 7 * 24 * 3600
+
+# Максимум записей в кэше; при переполнении вытесняется запись, к которой
+# дольше всего не обращались
+QUERY_CACHE_CAPACITY = int(os.getenv("QUERY_CACHE_CAPACITY", "10000"))
+
+# Матрица эмбеддингов растет порциями по столько строк, а не на каждую вставку
+QUERY_CACHE_GROW_ROWS = 1024
+
+# С какого размера кэша сходство считается параллельным ядром numba: на
+# маленьких матрицах запуск потоков дороже самого расчета
+NUMBA_MIN_ROWS = 4096
+
+# Без numba int8-строки переводятся во float32 блоками по столько строк,
+# чтобы временный массив оставался небольшим
+DEQUANT_BLOCK_ROWS = 1024
+
+
+@functools.lru_cache(maxsize=1)
+def _get_int8_scan():
+    """
+    Импортирует numba и компилирует ядро int8-сходства при первом вызове.
+    
+    Импорт numba заметно удлиняет запуск, а маленькому кэшу хватает numpy,
+    поэтому numba загружается, только когда кэш дорастает до NUMBA_MIN_ROWS.
+    
+    Returns:
+        Скомпилированная функция или None, если numba не установлен
+        (numba необязателен: без него сходство считается через numpy)
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+    
+    @njit(parallel=True, cache=True)
+    def int8_scan(codes, query_codes):
+        n, d = codes.shape
+        out = np.empty(n, dtype=np.int32)
+        for i in prange(n):
+            s = np.int32(0)
+            for k in range(d):
+                s += np.int32(codes[i, k]) * np.int32(query_codes[k])
+            out[i] = s
+        return out
+    
+    return int8_scan
+
+
+def _quantize(vectors: np.ndarray):
+    """
+    Квантует векторы в int8 с одним масштабом на вектор.
+    
+    Returns:
+        (int8 коды, float32 масштабы): vector ~= codes * scale
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.rint(vectors / scales[..., None]).astype(np.int8)
+    return codes, scales
+
+
+def _similarities(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Скалярные произведения квантованных строк с вектором запроса."""
+    n = codes.shape[0]
+    int8_scan = _get_int8_scan() if n >= NUMBA_MIN_ROWS else None
+    if int8_scan is not None:
+        # Целочисленное накопление int8 x int8 -> int32
+        query_codes, query_scale = _quantize(query)
+        return int8_scan(codes, query_codes) * (scales * query_scale)
+    
+    query = np.asarray(query, dtype=np.float32)
+    out = np.empty(n, dtype=np.float32)
+    for start in range(0, n, DEQUANT_BLOCK_ROWS):
+        block = codes[start:start + DEQUANT_BLOCK_ROWS]
+        out[start:start + block.shape[0]] = block.astype(np.float32) @ query
+    return out * scales
+
+
+class SemanticQueryCache:
+    """
+    Кэш (эмбеддинг запроса, параметры поиска) -> результаты поиска.
+    
+    Два уровня поиска: точное совпадение текста запроса (словарь по SHA-256)
+    и семантическое совпадение эмбеддинга. Размер ограничен capacity,
+    лишние записи вытесняются по давности последнего обращения (LRU).
+    """
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        tau: float = QUERY_CACHE_TAU,
+        version: Optional[str] = None,
+        ttl: Optional[float] = QUERY_CACHE_TTL,
+        capacity: int = QUERY_CACHE_CAPACITY
+    ):
+        """
+        Создает кэш и загружает сохраненные записи, если они есть.
+        
+        Если указан path, кэш сохраняется в файл при выходе из интерпретатора.
+        
+        Args:
+            path: Путь к .npz файлу кэша (None - только в памяти)
+            tau: Порог косинусного сходства для попадания в кэш
+            version: Версия индекса; записи, сохраненные для другой версии,
+                     не загружаются
+            ttl: Время жизни записи в секундах; более старые записи
+                 не загружаются и удаляются при поиске (None - без ограничения)
+            capacity: Максимальное количество записей
+        """
+        self.path = path
+        self.tau = tau
+        self.version = version
+        self.ttl = ttl
+        self.capacity = max(1, capacity)
+        self.size = 0
+        # Эмбеддинги записей: int8 коды (N, d) и float32 масштабы (N,)
+        self.codes = None
+        self.scales = None
+        # Время добавления записей и последнего обращения к ним (unix time)
+        self.created = None
+        self.used = None
+        self.keys = []
+        self.payloads = []
+        # SHA-256 текста запроса и параметров поиска для каждой записи
+        # и обратный словарь для точного поиска
+        self.hashes = []
+        self._exact = {}
+        self.hits = 0
+        self.misses = 0
+        # Есть ли несохраненные изменения
+        self._dirty = False
+        
+        if path:
+            if os.path.exists(path):
+                self.load()
+            atexit.register(self.save)
+    
+    @staticmethod
+    def make_key(
+        n_results: int,
+        where: Optional[Dict] = None,
+        search_params: Optional[Dict] = None
+    ) -> str:
+        """
+        Ключ параметров поиска: результаты с другими параметрами не подходят.
+        
+        Args:
+            n_results: Количество результатов
+            where: Фильтр по метаданным
+            search_params: Параметры приближенного поиска (ef_search, nprobe),
+                           от которых зависят найденные документы
+        """
+        # Множества значений фильтра ({"type": {"txt", "html"}}) - в сортированный список
+        return json.dumps(
+            [n_results, where, search_params or {}],
+            sort_keys=True, ensure_ascii=False, default=sorted
+        )
+    
+    @staticmethod
+    def query_hash(query: str, key: str = "") -> str:
+        """SHA-256 текста запроса вместе с ключом параметров поиска."""
+        return hashlib.sha256(f"{query.strip()}\0{key}".encode('utf-8')).hexdigest()
+    
+    def _hit(self, row: int) -> Dict:
+        """Отмечает обращение к записи и возвращает ее результаты."""
+        self.hits += 1
+        self.used[row] = time.time()
+        self._dirty = True
+        return self.payloads[row]
+    
+    def lookup_exact(self, query: str, key: str = "") -> Optional[Dict]:
+        """
+        Ищет в кэше результаты для дословно того же запроса.
+        
+        Промахи не учитываются в статистике: за точным поиском обычно
+        следует семантический lookup().
+        
+        Args:
+            query: Текст запроса
+            key: Ключ параметров поиска из make_key()
+        
+        Returns:
+            Сохраненные результаты поиска или None
+        """
+        row = self._exact.get(self.query_hash(query, key))
+        if row is None:
+            return None
+        if self._is_expired(row):
+            self._drop_expired()
+            return None
+        return self._hit(row)
+    
+    def lookup(self, query_embedding: np.ndarray, key: str = "") -> Optional[Dict]:
+        """
+        Ищет в кэше результаты для похожего запроса.
+        
+        Args:
+            query_embedding: Нормализованный эмбеддинг запроса
+            key: Ключ параметров поиска из make_key()
+        
+        Returns:
+            Сохраненные результаты поиска или None
+        """
+        self._drop_expired()
+        if self.size:
+            sims = _similarities(
+                self.codes[:self.size], self.scales[:self.size], query_embedding
+            )
+            best = int(np.argmax(sims))
+            if sims[best] >= self.tau:
+                if self.keys[best] == key:
+                    return self._hit(best)
+                # Ближайшая запись сделана с другими параметрами поиска -
+                # проверяем остальные похожие записи
+                for i in np.flatnonzero(sims >= self.tau):
+                    if self.keys[i] == key:
+                        return self._hit(int(i))
+        self.misses += 1
+        return None
+    
+    def _is_expired(self, row: int) -> bool:
+        """Проверяет, старше ли запись ttl."""
+        return self.ttl is not None and self.created[row] < time.time() - self.ttl
+    
+    def _drop_expired(self):
+        """Удаляет записи старше ttl (кэш может работать дольше ttl)."""
+        if self.ttl is None or not self.size:
+            return
+        keep = self.created[:self.size] >= time.time() - self.ttl
+        if not keep.all():
+            self._keep_rows(keep)
+    
+    def _keep_rows(self, keep: np.ndarray):
+        """
+        Оставляет только отмеченные записи.
+        
+        Args:
+            keep: Булев массив длины size
+        """
+        for name in ('codes', 'scales', 'created', 'used'):
+            setattr(self, name, getattr(self, name)[:self.size][keep])
+        self.keys = [k for k, f in zip(self.keys, keep) if f]
+        self.payloads = [p for p, f in zip(self.payloads, keep) if f]
+        self.hashes = [h for h, f in zip(self.hashes, keep) if f]
+        self._exact = {h: row for row, h in enumerate(self.hashes) if h}
+        self.size = self.codes.shape[0]
+        # Удаленные записи исчезнут из файла при сохранении
+        self._dirty = True
+    
+    def _next_row(self, dimension: int) -> int:
+        """Возвращает строку для новой записи: свободную или вытесняемую."""
+        if self.size >= self.capacity:
+            # Вытесняем запись, к которой дольше всего не обращались
+            row = int(np.argmin(self.used[:self.size]))
+            old_hash = self.hashes[row]
+            if self._exact.get(old_hash) == row:
+                del self._exact[old_hash]
+            return row
+        
+        if self.codes is None:
+            rows = min(QUERY_CACHE_GROW_ROWS, self.capacity)
+            self.codes = np.empty((rows, dimension), dtype=np.int8)
+            self.scales = np.empty(rows, dtype=np.float32)
+            self.created = np.empty(rows, dtype=np.float64)
+            self.used = np.empty(rows, dtype=np.float64)
+        elif self.size == self.codes.shape[0]:
+            rows = min(self.size + QUERY_CACHE_GROW_ROWS, self.capacity)
+            for name in ('codes', 'scales', 'created', 'used'):
+                old = getattr(self, name)
+                grown = np.empty((rows,) + old.shape[1:], dtype=old.dtype)
+                grown[:self.size] = old[:self.size]
+                setattr(self, name, grown)
+        
+        self.keys.append(None)
+        self.payloads.append(None)
+        self.hashes.append(None)
+        self.size += 1
+        return self.size - 1
+    
+    def add(
+        self,
+        query_embedding: np.ndarray,
+        payload: Dict,
+        key: str = "",
+        query: Optional[str] = None
+    ):
+        """
+        Добавляет результаты поиска в кэш.
+        
+        Args:
+            query_embedding: Нормализованный эмбеддинг запроса
+            payload: Результаты поиска
+            key: Ключ параметров поиска из make_key()
+            query: Текст запроса для точного поиска (None - только семантический)
+        """
+        codes, scale = _quantize(query_embedding)
+        row = self._next_row(codes.shape[0])
+        
+        now = time.time()
+        self.codes[row] = codes
+        self.scales[row] = scale
+        self.created[row] = now
+        self.used[row] = now
+        self.keys[row] = key
+        self.payloads[row] = payload
+        self.hashes[row] = self.query_hash(query, key) if query is not None else ""
+        if query is not None:
+            self._exact[self.hashes[row]] = row
+        self._dirty = True
+    
+    def clear(self, version: Optional[str] = None):
+        """
+        Удаляет все записи, например после переиндексации.
+        
+        Args:
+            version: Новая версия индекса
+        """
+        self.version = version
+        self.size = 0
+        self.codes = self.scales = self.created = self.used = None
+        self.keys = []
+        self.payloads = []
+        self.hashes = []
+        self._exact = {}
+        self._dirty = True
+    
+    def load(self):
+        """
+        Загружает записи из файла, если они сохранены для той же версии индекса.
+        
+        Записи старше ttl пропускаются; если записей больше capacity,
+        остаются те, к которым обращались последними.
+        """
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data['version']) != str(self.version):
+                    return
+                codes = data['codes']
+                scales = data['scales']
+                created = data['created']
+                used = data['used']
+                keys = json.loads(str(data['keys']))
+                payloads = json.loads(str(data['payloads']))
+                hashes = json.loads(str(data['hashes']))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ Не удалось загрузить кэш запросов: {str(e)}")
+            return
+        
+        self.codes = codes
+        self.scales = scales
+        self.created = created
+        self.used = used
+        self.size = codes.shape[0]
+        self.keys = keys
+        self.payloads = payloads
+        self.hashes = hashes
+        self._exact = {h: row for row, h in enumerate(hashes) if h}
+        
+        keep = np.ones(self.size, dtype=bool)
+        if self.ttl is not None:
+            keep &= created >= time.time() - self.ttl
+        if keep.sum() > self.capacity:
+            rows = np.flatnonzero(keep)
+            keep[:] = False
+            keep[rows[np.argsort(used[rows])[-self.capacity:]]] = True
+        if not keep.all():
+            self._keep_rows(keep)
+    
+    def save(self):
+        """
+        Сохраняет записи в сжатый файл (во временный файл, затем переименование).
+        
+        Если с момента загрузки или прошлого сохранения ничего не изменилось,
+        файл не перезаписывается.
+        """
+        if not self.path or not self._dirty:
+            return
+        if not self.size:
+            # Пустой кэш не сохраняется, а устаревший файл удаляется
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._dirty = False
+            return
+        
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            version=np.array(str(self.version)),
+            codes=self.codes[:self.size],
+            scales=self.scales[:self.size],
+            created=self.created[:self.size],
+            used=self.used[:self.size],
+            keys=np.array(json.dumps(self.keys, ensure_ascii=False)),
+            payloads=np.array(json.dumps(self.payloads, ensure_ascii=False)),
+            hashes=np.array(json.dumps(self.hashes))
+        )
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+def _search_params(client) -> Dict:
+    """Параметры приближенного поиска клиента для ключа кэша."""
+    return {
+        'ef_search': getattr(client, 'ef_search', None),
+        'nprobe': getattr(client, 'nprobe', None)
+    }
+
+
+def cached_search(
+    client,
+    cache: SemanticQueryCache,
+    query: str,
+    n_results: int = 5,
+    where: Optional[Dict] = None,
+    openai_api_key: Optional[str] = None
+) -> Dict:
+    """
+    Выполняет поиск через клиент, используя семантический кэш.
+    
+    Дословный повтор запроса обслуживается без создания эмбеддинга.
+    Иначе эмбеддинг запроса создается один раз: он же используется и для
+    поиска в кэше, и (при промахе) для поиска в индексе - client.search
+    получает только готовый эмбеддинг и сам OpenAI не вызывает.
+    
+    Args:
+        client: Клиент векторной базы с методами embed_query и search
+        cache: Семантический кэш
+        query: Поисковый запрос
+        n_results: Количество результатов
+        where: Фильтр по метаданным
+        openai_api_key: API ключ OpenAI
+    
+    Returns:
+        Словарь с результатами поиска
+    """
+    key = cache.make_key(n_results, where, _search_params(client))
+    results = cache.lookup_exact(query, key)
+    if results is not None:
+        return results
+    
+    query_embedding = client.embed_query(query, openai_api_key)
+    results = cache.lookup(query_embedding, key)
+    if results is None:
+        results = client.search(
+            n_results=n_results,
+            where=where,
+            query_embedding=query_embedding
+        )
+        cache.add(query_embedding, results, key, query=query)
+    return results
+
+
+def cached_search_batch(
+    client,
+    cache: SemanticQueryCache,
+    queries: List[str],
+    n_results: int = 5,
+    where: Optional[Dict] = None,
+    openai_api_key: Optional[str] = None
+) -> List[Dict]:
+    """
+    Выполняет поиск по списку запросов, используя семантический кэш.
+    
+    Запросы, не найденные в кэше дословно, получают эмбеддинги одним
+    обращением к OpenAI, а промахи семантического кэша ищутся в индексе
+    одним вызовом client.search_batch (матрица запросов вместо отдельного
+    поиска на каждый).
+    
+    Args:
+        client: Клиент векторной базы с методами embed_texts и search_batch
+        cache: Семантический кэш
+        queries: Поисковые запросы
+        n_results: Количество результатов для каждого запроса
+        where: Фильтр по метаданным
+        openai_api_key: API ключ OpenAI
+    
+    Returns:
+        Список словарей с результатами, в порядке запросов
+    """
+    key = cache.make_key(n_results, where, _search_params(client))
+    results = [cache.lookup_exact(query, key) for query in queries]
+    
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+    
+    embeddings = client.embed_texts(
+        [queries[i].strip() for i in pending], openai_api_key
+    )
+    misses = []
+    for row, i in enumerate(pending):
+        results[i] = cache.lookup(embeddings[row], key)
+        if results[i] is None:
+            misses.append(row)
+    
+    if misses:
+        found = client.search_batch(
+            n_results=n_results,
+            where=where,
+            query_embeddings=embeddings[misses]
+        )
+        # search_batch возвращает столбцы по всем запросам сразу -
+        # раскладываем их в отдельный словарь на каждый запрос
+        for j, row in enumerate(misses):
+            result = {name: [column[j]] for name, column in found.items()}
+            results[pending[row]] = result
+            cache.add(embeddings[row], result, key, query=queries[pending[row]])
+    return results
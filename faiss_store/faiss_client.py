@@ -11,10 +11,71 @@ FAISS - это библиотека от Facebook для эффективног
 import faiss
 import numpy as np
 import pickle
+import sqlite3
+import json
+import hashlib
+import functools
 import os
 from pathlib import Path
-from typing import List, Dict, Optional
-import openai
+from typing import List, Dict, Optional, Tuple
+
+from embeddings import EmbeddingCache, create_embeddings
+
+
+# Модель OpenAI для создания эмбеддингов
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Векторы нормализуются до единичной длины, поэтому все индексы используют
+# скалярное произведение (косинусное сходство) вместо L2: это тот же порядок
+# результатов без вычисления норм на каждую пару векторов
+METRIC = faiss.METRIC_INNER_PRODUCT
+
+# Поддерживаемые типы индексов:
+# - flat:  точный полный перебор (IndexFlatIP), O(N·d) на каждый запрос
+# - hnsw:  граф HNSW, приближенный поиск с высокой полнотой, O(log N)
+# - ivfpq: инвертированные списки + Product Quantization, экономит память,
+#          требует обучения на первой порции векторов
+# - sq8:   полный перебор по векторам, квантованным в int8 (в 4 раза меньше
+#          байт на вектор, чем float32)
+# - ivfsq8: инвертированные списки поверх int8-векторов
+# - sqfp16: полный перебор по векторам в float16 (в 2 раза меньше байт,
+#           чем float32, без обучения и практически без потери точности)
+INDEX_TYPES = ('flat', 'hnsw', 'ivfpq', 'sq8', 'ivfsq8', 'sqfp16')
+
+# Параметры HNSW
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Параметры IVF-PQ
+IVF_NLIST = 4096
+# Сколько ближайших кластеров IVF просматривается при поиске (по умолчанию
+# FAISS смотрит только один, что заметно снижает полноту)
+IVF_NPROBE = 16
+PQ_M = 16
+PQ_NBITS = 8
+
+# Минимальный размер индекса для поиска на GPU: на маленьких индексах
+# копирование данных на устройство дороже самого поиска
+GPU_MIN_VECTORS = 20000
+
+# Размер "хвоста" - небольшого индекса полного перебора, куда попадают новые
+# векторы. Когда в нем набирается столько векторов, они переносятся в основной
+# (ANN) индекс одной пачкой: построение графа HNSW и обучение IVF выполняются
+# на большой порции данных, а не на каждом вызове add_documents
+TAIL_MAX_VECTORS = 10000
+
+# Запас кандидатов при поиске с фильтром по метаданным: FAISS ничего не знает
+# о фильтре, поэтому запрашивается больше результатов, чем нужно. Если после
+# фильтрации их не хватает, запас удваивается, пока не будет пройден весь индекс
+FILTER_OVERFETCH = 4
+FILTER_MIN_CANDIDATES = 64
+
+# Ограничение на число параметров в одном SQL-запросе (у старых SQLite - 999)
+SQLITE_MAX_VARS = 900
+
+# Сколько эмбеддингов последних поисковых запросов держать в памяти
+QUERY_EMBEDDING_LRU_SIZE = 1024
 
 
 class FAISSClient:
@@ -26,7 +87,20 @@ class FAISSClient:
     def __init__(
         self, 
         persist_directory: str = "./faiss_db",
-        index_name: str = "documents"
+        index_name: str = "documents",
+        index_type: str = "hnsw",
+        index_factory: Optional[str] = None,
+        ef_search: int = HNSW_EF_SEARCH,
+        nprobe: int = IVF_NPROBE,
+        embedding_dim: int = 512,
+        use_embedding_cache: bool = True,
+        embed_concurrency: int = 8,
+        embed_batch_size: int = 100,
+        use_gpu: bool = True,
+        gpu_min_vectors: int = GPU_MIN_VECTORS,
+        num_threads: Optional[int] = None,
+        tail_size: int = TAIL_MAX_VECTORS,
+        use_precomputed_tables: bool = True
     ):
         """
         Инициализирует клиент FAISS.
@@ -34,97 +108,781 @@ class FAISSClient:
         Args:
             persist_directory: Директория для хранения данных FAISS
             index_name: Имя индекса для хранения документов
+            index_type: Тип создаваемого индекса: 'flat', 'hnsw', 'ivfpq',
+                        'sq8', 'ivfsq8' или 'sqfp16'
+            index_factory: Строка faiss.index_factory (например, "HNSW32,Flat"
+                           или "IVF4096,PQ64") вместо index_type
+            ef_search: Размер очереди кандидатов HNSW при поиске
+            nprobe: Количество просматриваемых кластеров IVF при поиске
+            embedding_dim: Размерность эмбеддингов. Модели text-embedding-3
+                           умеют возвращать укороченные (Matryoshka) векторы,
+                           что в 3 раза уменьшает индекс по сравнению с 1536
+            use_embedding_cache: Кэшировать эмбеддинги на диске, чтобы не
+                                 отправлять один и тот же текст в OpenAI повторно
+            embed_concurrency: Максимальное число одновременных запросов
+                               к OpenAI при создании эмбеддингов
+            embed_batch_size: Количество текстов в одном запросе к OpenAI
+            use_gpu: Использовать GPU (если есть faiss-gpu и CUDA) для поиска
+                     по большим индексам и для обучения IVF-индексов
+            gpu_min_vectors: С какого размера индекса искать на GPU. Для
+                             пакетного поиска копирование окупается и на
+                             небольших индексах (0 - всегда)
+            num_threads: Число потоков OpenMP для FAISS (по умолчанию - число ядер)
+            tail_size: Сколько новых векторов накапливать в индексе полного
+                       перебора перед переносом в основной индекс
+                       (не используется для index_type='flat')
+            use_precomputed_tables: Использовать предвычисленные таблицы IVFPQ.
+                                    Они ускоряют поиск, но занимают
+                                    nlist * M * 256 float в памяти
         """
+        if index_factory:
+            index_type = 'factory'
+        elif index_type not in INDEX_TYPES:
+            raise ValueError(
+                f"Неизвестный тип индекса: {index_type}. "
+                f"Допустимые значения: {', '.join(INDEX_TYPES)}"
+            )
+        
+        # Настройка глобальная для процесса: FAISS распараллеливает поиск
+        # по пачке запросов и перебор векторов через OpenMP
+        faiss.omp_set_num_threads(num_threads or os.cpu_count() or 1)
+        
         self.persist_directory = Path(persist_directory)
         self.index_name = index_name
+        self.index_type = index_type
+        self.index_factory = index_factory
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.use_precomputed_tables = use_precomputed_tables
         self.index = None
-        self.documents = []  # Список текстов
-        self.metadatas = []  # Список метаданных
-        self.ids = []  # Список ID
-        self.dimension = 1536  # Размерность для OpenAI embeddings
+        # Новые векторы сначала попадают в tail_index (полный перебор),
+        # поиск идет по обоим индексам. Для flat хвост не нужен
+        self.tail_index = None
+        self.tail_size = tail_size
+        # int64 ID устаревших векторов основного индекса, который не умеет
+        # remove_ids (граф HNSW). Такие векторы скрываются при поиске и
+        # выбрасываются при перестройке индекса (_compact_index)
+        self._tombstones: set = set()
+        # Индекс, загруженный через mmap, доступен только для чтения
+        self._read_only = False
+        # Тексты, метаданные и строковые ID хранятся в SQLite по int64 ID,
+        # которые FAISS хранит вместе с векторами (IndexIDMap2). Так в памяти
+        # не держится весь корпус, а добавление не переписывает все данные
+        self._db: Optional[sqlite3.Connection] = None
+        # Метаданные для фильтрации в виде столбцов (structure of arrays):
+        # отсортированные int64 ID и по numpy-массиву на каждый ключ.
+        # Строятся из SQLite при первом поиске с фильтром
+        self._meta_ids: Optional[np.ndarray] = None
+        self._meta_cols: Dict[str, np.ndarray] = {}
+        # Число документов в SQLite. COUNT(*) проходит всю таблицу, поэтому
+        # считается один раз и сбрасывается при каждом изменении документов
+        self._doc_count: Optional[int] = None
+        # Размерность для OpenAI embeddings. При загрузке существующего индекса
+        # заменяется сохраненной, чтобы запросы совпадали по размерности
+        self.dimension = embedding_dim
+        
+        # На GPU хранится копия индекса только для поиска. Индекс на CPU остается
+        # основным: в него добавляются и из него удаляются векторы, он же
+        # сохраняется на диск. После изменений копия создается заново
+        self.use_gpu = use_gpu and hasattr(faiss, 'get_num_gpus') and faiss.get_num_gpus() > 0
+        self.gpu_min_vectors = gpu_min_vectors
+        self._gpu_resources = None
+        self._gpu_index = None
         
         # Создаем директорию если не существует
         self.persist_directory.mkdir(parents=True, exist_ok=True)
         
+        # Кэш не зависит от индекса и переживает его пересоздание
+        self.embed_concurrency = embed_concurrency
+        self.embed_batch_size = embed_batch_size
+        self.embedding_cache = None
+        if use_embedding_cache:
+            self.embedding_cache = EmbeddingCache(
+                str(self.persist_directory / "embeddings_cache.db")
+            )
+        
+        # Повторный ввод того же запроса не обращается ни к OpenAI, ни к кэшу
+        # на диске. LRU создается на экземпляр, чтобы не держать ссылку на self
+        # в глобальном кэше
+        self._query_embedding_lru = functools.lru_cache(
+            maxsize=QUERY_EMBEDDING_LRU_SIZE
+        )(self._embed_query_uncached)
+        
         print(f"FAISS инициализирован. Директория: {persist_directory}")
     
     def _get_index_path(self) -> Path:
         return self.persist_directory / f"{self.index_name}.index"
     
+    def _get_tail_path(self) -> Path:
+        return self.persist_directory / f"{self.index_name}.tail.index"
+    
+    def _get_db_path(self) -> Path:
+        return self.persist_directory / f"{self.index_name}.db"
+    
+    def _get_columns_path(self) -> Path:
+        return self.persist_directory / f"{self.index_name}.columns.arrow"
+    
     def _get_data_path(self) -> Path:
+        # Pickle-файл старого формата, переносится в SQLite при загрузке
         return self.persist_directory / f"{self.index_name}.pkl"
     
-    def create_index(self, dimension: int = 1536):
+    def _get_db(self) -> sqlite3.Connection:
+        """Открывает (один раз) SQLite-хранилище текстов и метаданных."""
+        if self._db is None:
+            self._db = sqlite3.connect(str(self._get_db_path()), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, "
+                "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS documents_doc_id ON documents (doc_id)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+    
+    def _fetch_records(self, int_ids: List[int]) -> Dict[int, Tuple[str, str, Dict]]:
+        """
+        Читает записи по int64 ID одним запросом на каждые SQLITE_MAX_VARS ID.
+        
+        Returns:
+            Словарь int ID -> (строковый ID, текст, метаданные)
+        """
+        db = self._get_db()
+        records = {}
+        for i in range(0, len(int_ids), SQLITE_MAX_VARS):
+            batch = int_ids[i:i + SQLITE_MAX_VARS]
+            placeholders = ",".join("?" * len(batch))
+            rows = db.execute(
+                f"SELECT id, doc_id, text, metadata FROM documents WHERE id IN ({placeholders})",
+                batch
+            )
+            for int_id, doc_id, text, metadata in rows:
+                records[int_id] = (doc_id, text, json.loads(metadata))
+        return records
+    
+    def _existing_ids(self, ids: List[str]) -> List[int]:
+        """
+        Возвращает int64 ID уже сохраненных документов с указанными строковыми ID.
+        
+        Поиск идет по строковому ID, а не по хешу: у документов, перенесенных
+        из старого формата, int64 ID совпадает с порядковым номером.
+        """
+        db = self._get_db()
+        existing = []
+        for i in range(0, len(ids), SQLITE_MAX_VARS):
+            batch = ids[i:i + SQLITE_MAX_VARS]
+            placeholders = ",".join("?" * len(batch))
+            rows = db.execute(
+                f"SELECT id FROM documents WHERE doc_id IN ({placeholders})", batch
+            )
+            existing.extend(row[0] for row in rows)
+        return existing
+    
+    def _vector_count(self) -> int:
+        """Число актуальных векторов в основном индексе и в хвосте."""
+        tail_count = self.tail_index.ntotal if self.tail_index is not None else 0
+        return self.index.ntotal - len(self._tombstones) + tail_count
+    
+    def _count_documents(self) -> int:
+        if self._doc_count is None:
+            self._doc_count = self._get_db().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return self._doc_count
+    
+    def _write_info(self):
+        """Сохраняет параметры индекса рядом с документами."""
+        db = self._get_db()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+                [
+                    ('dimension', str(self.dimension)),
+                    ('index_type', self.index_type),
+                    ('index_factory', self.index_factory or '')
+                ]
+            )
+    
+    @staticmethod
+    def _object_column(values: List) -> np.ndarray:
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    
+    @staticmethod
+    def _mark_columns_stale(db: sqlite3.Connection):
+        """
+        Помечает файл столбцов метаданных устаревшим.
+        
+        Вызывается внутри транзакции, изменяющей документы, поэтому даже при
+        сбое до save_index файл столбцов не будет прочитан с неверными данными.
+        """
+        db.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('columns_valid', '0')")
+    
+    def _save_meta_columns(self):
+        """
+        Сохраняет столбцы метаданных в файл Arrow IPC (если установлен pyarrow).
+        
+        Файл читается через mmap без разбора JSON каждой записи, поэтому
+        первый поиск с фильтром в новом процессе не перечитывает всю таблицу
+        documents. Сохраняются только уже построенные в памяти столбцы.
+        """
+        if self._meta_ids is None:
+            return
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return
+        
+        try:
+            table = pa.table({
+                "id": self._meta_ids,
+                **{
+                    f"meta_{key}": pa.array(column.tolist())
+                    for key, column in self._meta_cols.items()
+                }
+            })
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Значения разных типов под одним ключом: столбцы будут
+            # строиться из SQLite
+            return
+        
+        columns_path = self._get_columns_path()
+        tmp_path = columns_path.with_name(columns_path.name + ".tmp")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, columns_path)
+        
+        db = self._get_db()
+        with db:
+            db.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('columns_valid', '1')")
+    
+    def _load_meta_columns(self) -> bool:
+        """
+        Читает столбцы метаданных из файла Arrow IPC, если он актуален.
+        
+        Returns:
+            True если столбцы загружены
+        """
+        columns_path = self._get_columns_path()
+        if not columns_path.exists():
+            return False
+        valid = self._get_db().execute(
+            "SELECT value FROM info WHERE key = 'columns_valid'"
+        ).fetchone()
+        if valid is None or valid[0] != '1':
+            return False
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return False
+        
+        with pa.memory_map(str(columns_path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+        self._meta_ids = table.column("id").to_numpy()
+        self._meta_cols = {
+            name[len("meta_"):]: self._object_column(table.column(name).to_pylist())
+            for name in table.column_names
+            if name.startswith("meta_")
+        }
+        return True
+    
+    def _get_meta_columns(self) -> Dict[str, np.ndarray]:
+        """
+        Возвращает столбцы метаданных.
+        
+        Столбцы читаются из файла Arrow, а если его нет или он устарел -
+        строятся из SQLite и сохраняются в файл для следующих запусков.
+        """
+        if self._meta_ids is None and not self._load_meta_columns():
+            rows = self._get_db().execute(
+                "SELECT id, metadata FROM documents ORDER BY id"
+            ).fetchall()
+            metadatas = [json.loads(metadata) for _, metadata in rows]
+            keys = {key for metadata in metadatas for key in metadata}
+            self._meta_ids = np.array([int_id for int_id, _ in rows], dtype='int64')
+            self._meta_cols = {
+                key: self._object_column([metadata.get(key) for metadata in metadatas])
+                for key in keys
+            }
+            self._save_meta_columns()
+        return self._meta_cols
+    
+    def _append_meta_columns(self, int_ids: List[int], metadatas: List[Dict]):
+        """Добавляет метаданные новых документов в уже построенные столбцы."""
+        if self._meta_ids is None:
+            return
+        
+        new_ids = np.array(int_ids, dtype='int64')
+        # Замененные документы (upsert) убираем из старых строк
+        keep = ~np.isin(self._meta_ids, new_ids)
+        n_old = int(keep.sum())
+        keys = set(self._meta_cols) | {key for metadata in metadatas for key in metadata}
+        
+        ids = np.concatenate([self._meta_ids[keep], new_ids])
+        order = np.argsort(ids, kind='stable')
+        self._meta_ids = ids[order]
+        
+        columns = {}
+        for key in keys:
+            old = self._meta_cols.get(key)
+            old = old[keep] if old is not None else self._object_column([None] * n_old)
+            new = self._object_column([metadata.get(key) for metadata in metadatas])
+            columns[key] = np.concatenate([old, new])[order]
+        self._meta_cols = columns
+    
+    def _drop_meta_rows(self, int_ids: List[int]):
+        """Удаляет строки удаленных документов из столбцов метаданных."""
+        if self._meta_ids is None:
+            return
+        keep = ~np.isin(self._meta_ids, np.array(int_ids, dtype='int64'))
+        self._meta_ids = self._meta_ids[keep]
+        self._meta_cols = {key: column[keep] for key, column in self._meta_cols.items()}
+    
+    def _where_mask(self, int_ids: np.ndarray, where: Dict) -> np.ndarray:
+        """
+        Вычисляет фильтр по метаданным сразу для всех кандидатов.
+        
+        Args:
+            int_ids: int64 ID кандидатов, возвращенные FAISS
+            where: Фильтр по метаданным (например, {"type": "txt"}); список
+                   значений означает "любое из них": {"type": ["txt", "html"]}
+            
+        Returns:
+            Булев массив: True для кандидатов, подходящих под фильтр
+        """
+        columns = self._get_meta_columns()
+        if len(self._meta_ids) == 0:
+            return np.zeros(len(int_ids), dtype=bool)
+        
+        positions = np.searchsorted(self._meta_ids, int_ids)
+        positions = np.minimum(positions, len(self._meta_ids) - 1)
+        mask = self._meta_ids[positions] == int_ids
+        
+        for key, value in where.items():
+            allowed = value if isinstance(value, (list, tuple, set, frozenset)) else (value,)
+            column = columns.get(key)
+            if column is None:
+                # Ключа нет ни у одного документа: metadata.get(key) вернет None
+                mask &= None in allowed
+                continue
+            
+            values = column[positions]
+            # Столбцы object-типа (значения разных типов не сортируются),
+            # поэтому вместо np.isin - сравнение с каждым допустимым значением
+            match = np.zeros(len(values), dtype=bool)
+            for item in allowed:
+                match |= values == item
+            mask &= match
+        return mask
+    
+    @staticmethod
+    def _to_int_id(doc_id: str) -> int:
         """
-        Создает новый FAISS индекс.
+        Преобразует строковый ID документа в неотрицательный int64 для FAISS.
+        
+        ID вычисляется как хеш, поэтому он стабилен между запусками
+        и не зависит от порядка добавления документов.
+        """
+        digest = hashlib.blake2b(doc_id.encode('utf-8'), digest_size=8).digest()
+        # Старший бит сбрасываем: FAISS использует -1 как признак "нет результата"
+        return int.from_bytes(digest, 'little') & 0x7FFFFFFFFFFFFFFF
+    
+    def _get_gpu_resources(self):
+        if self._gpu_resources is None:
+            self._gpu_resources = faiss.StandardGpuResources()
+        return self._gpu_resources
+    
+    def _get_search_index(self):
+        """
+        Возвращает индекс для поиска: копию на GPU для больших индексов
+        или сам индекс на CPU.
+        """
+        if not self.use_gpu or self.index.ntotal < self.gpu_min_vectors:
+            return self.index
+        
+        if self._gpu_index is None:
+            try:
+                self._gpu_index = faiss.index_cpu_to_gpu(
+                    self._get_gpu_resources(), 0, self.index
+                )
+                print(f"Индекс скопирован на GPU ({self.index.ntotal} векторов)")
+            except Exception as e:
+                # Например, HNSW не имеет реализации на GPU
+                print(f"Поиск на GPU недоступен для {self.index_type}: {str(e)}")
+                self.use_gpu = False
+                return self.index
+        return self._gpu_index
+    
+    def _train_index(self, embeddings: np.ndarray):
+        """
+        Обучает индекс. Для IVF-индексов k-means по центроидам выполняется
+        на GPU, если он доступен.
+        """
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if self.use_gpu and ivf is not None:
+            ivf.clustering_index = faiss.index_cpu_to_gpu(
+                self._get_gpu_resources(), 0,
+                faiss.IndexFlat(self.dimension, ivf.metric_type)
+            )
+        self.index.train(embeddings)
+    
+    def _build_index(self, dimension: int, n_train: Optional[int] = None):
+        """
+        Строит пустой FAISS индекс типа self.index_type.
+        
+        IVF-индексы сами хранят ID документов, остальные оборачиваются
+        в IndexIDMap2.
+        
+        Индексы HNSW и IVF выполняют приближенный поиск (ANN) и не
+        перебирают все векторы на каждый запрос, в отличие от IndexFlatIP.
+        Индексы sq8/ivfsq8 хранят векторы в int8 и читают в 4 раза меньше памяти,
+        sqfp16 - в float16 и в 2 раза меньше.
         
         Args:
             dimension: Размерность векторов
+            n_train: Количество векторов, доступных для обучения IVF-индексов
+                     (число кластеров nlist уменьшается под маленькие корпуса)
+        """
+        nlist = IVF_NLIST
+        if n_train is not None:
+            # faiss рекомендует не менее 39 обучающих векторов на кластер
+            nlist = max(1, min(IVF_NLIST, n_train // 39))
+        
+        if self.index_factory:
+            index = faiss.index_factory(dimension, self.index_factory, METRIC)
+            if hasattr(index, 'hnsw'):
+                index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        elif self.index_type == 'hnsw':
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M, METRIC)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        elif self.index_type == 'ivfpq':
+            quantizer = faiss.IndexFlatIP(dimension)
+            index = faiss.IndexIVFPQ(
+                quantizer, dimension, nlist, PQ_M, PQ_NBITS, METRIC
+            )
+        elif self.index_type == 'sq8':
+            index = faiss.IndexScalarQuantizer(
+                dimension, faiss.ScalarQuantizer.QT_8bit, METRIC
+            )
+        elif self.index_type == 'sqfp16':
+            index = faiss.IndexScalarQuantizer(
+                dimension, faiss.ScalarQuantizer.QT_fp16, METRIC
+            )
+        elif self.index_type == 'ivfsq8':
+            quantizer = faiss.IndexFlatIP(dimension)
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit, METRIC
+            )
+        else:
+            index = faiss.IndexFlatIP(dimension)
+        
+        # IVF хранит переданные ID прямо в инвертированных списках и сам
+        # корректно их удаляет. IndexIDMap2 поверх IVF при удалении ломается:
+        # id_map сдвигается, а внутренние номера в списках IVF - нет
+        if faiss.try_extract_index_ivf(index) is not None:
+            return self._apply_search_params(index)
+        
+        # IndexIDMap2 хранит соответствие ID -> вектор внутри FAISS
+        # и поддерживает remove_ids и reconstruct по ID
+        return self._apply_search_params(faiss.IndexIDMap2(index))
+    
+    def _apply_search_params(self, index):
+        """
+        Устанавливает параметры поиска efSearch (HNSW) и nprobe (IVF).
+        
+        ParameterSpace находит нужный вложенный индекс сам (сквозь IndexIDMap2
+        и т.п.); параметры, которых у индекса нет, пропускаются.
+        Если use_precomputed_tables=False, предвычисленные таблицы IVFPQ
+        отключаются и освобождаются.
+        """
+        params = faiss.ParameterSpace()
+        for name, value in (('efSearch', self.ef_search), ('nprobe', self.nprobe)):
+            try:
+                params.set_index_parameter(index, name, value)
+            except RuntimeError:
+                pass
+        
+        if not self.use_precomputed_tables:
+            ivf = faiss.try_extract_index_ivf(index)
+            if ivf is not None:
+                ivf = faiss.downcast_index(ivf)
+                if isinstance(ivf, faiss.IndexIVFPQ):
+                    ivf.use_precomputed_table = -1
+                    ivf.precomputed_table.resize(0)
+        return index
+    
+    def set_search_params(
+        self,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None
+    ):
+        """
+        Меняет параметры поиска efSearch (HNSW) и nprobe (IVF).
+        
+        Args:
+            ef_search: Размер очереди кандидатов HNSW (None - не менять)
+            nprobe: Количество просматриваемых кластеров IVF (None - не менять)
+        """
+        if ef_search is not None:
+            self.ef_search = ef_search
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if self.index is not None:
+            self._apply_search_params(self.index)
+            # Копия на GPU создается заново уже с новыми параметрами
+            self._gpu_index = None
+    
+    def _build_tail_index(self):
+        """Создает пустой хвостовой индекс с той же метрикой, что и основной."""
+        if self.index_type == 'flat' or self.index_factory == 'Flat':
+            return None
+        return faiss.IndexIDMap2(faiss.IndexFlat(self.dimension, self.index.metric_type))
+    
+    def create_index(self, dimension: int = 1536, n_train: Optional[int] = None):
+        """
+        Создает новый FAISS индекс типа self.index_type.
+        
+        Args:
+            dimension: Размерность векторов
+            n_train: Количество векторов, доступных для обучения IVF-индексов
         """
         self.dimension = dimension
-        self.index = faiss.IndexFlatL2(dimension)
-        self.documents = []
-        self.metadatas = []
-        self.ids = []
-        print(f"Создан новый индекс с размерностью {dimension}")
+        self.index = self._build_index(dimension, n_train)
+        self.tail_index = self._build_tail_index()
+        self._read_only = False
+        self._gpu_index = None
+        self._meta_ids = None
+        self._doc_count = None
+        self._tombstones = set()
+        
+        # Файлы прежнего индекса с тем же именем (хвост другого типа индекса,
+        # столбцы метаданных, недописанные временные файлы) больше не нужны
+        stale_paths = [self._get_tail_path(), self._get_columns_path()]
+        stale_paths += [
+            path.with_name(path.name + ".tmp")
+            for path in stale_paths + [self._get_index_path()]
+        ]
+        for path in stale_paths:
+            if path.exists():
+                os.remove(path)
+        
+        # Новый индекс начинается с пустого хранилища документов
+        db = self._get_db()
+        with db:
+            self._mark_columns_stale(db)
+            db.execute("DELETE FROM documents")
+        self._write_info()
+        print(f"Создан новый индекс {self.index_type} с размерностью {dimension}")
 
-    def load_index(self) -> bool:
+    def _read_index(self, mmap: bool):
+        """
+        Читает индекс с диска.
+        
+        Args:
+            mmap: Отобразить файл индекса в память (только для чтения)
+                  вместо полной загрузки в RAM
+        """
+        path = str(self._get_index_path())
+        if mmap:
+            try:
+                index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                self._read_only = True
+                return index
+            except RuntimeError:
+                # Старые версии faiss поддерживают mmap не для всех типов индексов
+                pass
+        self._read_only = False
+        return faiss.read_index(path)
+    
+    def _ensure_writable(self):
+        """Перечитывает индекс, загруженный через mmap, в память перед изменением."""
+        if self.index is not None and self._read_only:
+            self.index = self._read_index(mmap=False)
+            self._gpu_index = None
+            print(f"Индекс '{self.index_name}' загружен в память для записи")
+    
+    def load_index(self, mmap: bool = True, force: bool = False) -> bool:
         """
         Загружает существующий индекс с диска.
         
+        По умолчанию файл индекса отображается в память (mmap): векторы
+        подгружаются операционной системой по мере обращения к ним, и объем
+        занятой памяти зависит от запросов, а не от размера корпуса. Такой
+        индекс доступен только для чтения; add_documents и delete_documents
+        сами перечитывают его в память перед изменением.
+        
+        Повторный вызов для уже загруженного индекса ничего не делает.
+        
+        Args:
+            mmap: Отобразить индекс в память вместо полной загрузки
+            force: Перечитать индекс с диска, даже если он уже загружен
+        
         Returns:
             True если индекс загружен, False если не найден
         """
+        if self.index is not None and not force:
+            return True
+        
         index_path = self._get_index_path()
+        db_path = self._get_db_path()
         data_path = self._get_data_path()
         
-        if index_path.exists() and data_path.exists():
-            try:
-                self.index = faiss.read_index(str(index_path))
-                with open(data_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.documents = data['documents']
-                    self.metadatas = data['metadatas']
-                    self.ids = data['ids']
-                    self.dimension = data.get('dimension', 1536)
-                print(f"Индекс '{self.index_name}' загружен. Документов: {len(self.documents)}")
-                return True
-            except Exception as e:
-                print(f"Ошибка при загрузке индекса: {str(e)}")
-                return False
-        return False
+        if not index_path.exists():
+            return False
+        if not db_path.exists() and not data_path.exists():
+            return False
+        
+        try:
+            # Перенос из старого формата изменяет индекс, поэтому без mmap
+            self.index = self._apply_search_params(
+                self._read_index(mmap and db_path.exists())
+            )
+            self._gpu_index = None
+            self._meta_ids = None
+            self._doc_count = None
+            self._tombstones = set()
+            
+            if db_path.exists():
+                info = dict(self._get_db().execute("SELECT key, value FROM info"))
+                self.dimension = int(info.get('dimension', self.index.d))
+                self.index_type = info.get('index_type', 'flat')
+                self.index_factory = info.get('index_factory') or None
+            else:
+                self._migrate_pickle(data_path)
+            
+            # Хвост небольшой и часто меняется, поэтому читается в память.
+            # Для индексов без хвоста (flat) файл хвоста не читается, даже
+            # если остался от прежнего индекса с тем же именем
+            tail_path = self._get_tail_path()
+            self.tail_index = self._build_tail_index()
+            if self.tail_index is not None and tail_path.exists():
+                self.tail_index = faiss.read_index(str(tail_path))
+            
+            print(f"Индекс '{self.index_name}' загружен. Документов: {self._count_documents()}")
+            return True
+        except Exception as e:
+            print(f"Ошибка при загрузке индекса: {str(e)}")
+            return False
+    
+    def open(self, mmap: bool = True) -> Tuple[bool, Dict]:
+        """
+        Загружает индекс и возвращает его статистику.
+        
+        Число документов считается один раз при загрузке, поэтому
+        статистика не делает второго прохода по SQLite.
+        
+        Args:
+            mmap: Отобразить индекс в память вместо полной загрузки
+        
+        Returns:
+            (True, статистика) если индекс загружен, (False, {}) если не найден
+        """
+        if not self.load_index(mmap=mmap):
+            return False, {}
+        return True, self.get_index_stats()
+    
+    def _migrate_pickle(self, data_path: Path):
+        """
+        Переносит документы из pickle-файла старого формата в SQLite.
+        
+        В самом старом формате документы хранились параллельными списками,
+        а индекс не использовал IndexIDMap2 - ID вектора совпадал с его
+        порядковым номером. Такой индекс оборачивается в IndexIDMap2 с теми же
+        номерами в качестве ID, чтобы не пересчитывать эмбеддинги.
+        """
+        with open(data_path, 'rb') as f:
+            data = pickle.load(f)
+        
+        self.dimension = data.get('dimension', 1536)
+        # Индексы, сохраненные до появления index_type, всегда были flat
+        self.index_type = data.get('index_type', 'flat')
+        
+        documents = data['documents']
+        metadatas = data['metadatas']
+        ids = data['ids']
+        if isinstance(documents, list):
+            positions = range(len(documents))
+            documents = dict(zip(positions, documents))
+            metadatas = dict(zip(positions, metadatas))
+            ids = dict(zip(positions, ids))
+        
+        if not isinstance(self.index, faiss.IndexIDMap):
+            vectors = self.index.reconstruct_n(0, self.index.ntotal)
+            legacy_index = self.index
+            legacy_index.reset()
+            self.index = faiss.IndexIDMap2(legacy_index)
+            self.index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+        
+        db = self._get_db()
+        with db:
+            self._mark_columns_stale(db)
+            db.executemany(
+                "INSERT OR REPLACE INTO documents (id, doc_id, text, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (int_id, ids[int_id], text, json.dumps(metadatas[int_id], ensure_ascii=False))
+                    for int_id, text in documents.items()
+                ]
+            )
+        self._doc_count = None
+        self.save_index()
+        print(f"Документы перенесены из {data_path.name} в {self._get_db_path().name}")
     
     def save_index(self):
-        """Сохраняет индекс на диск."""
+        """
+        Сохраняет индекс на диск.
+        
+        Документы записываются в SQLite сразу при добавлении, поэтому здесь
+        сохраняется только сам FAISS индекс и его параметры.
+        """
         if self.index is None:
             raise Exception("Индекс не создан")
+        if self._tombstones:
+            self._compact_index()
         
-        index_path = self._get_index_path()
-        data_path = self._get_data_path()
-        
-        faiss.write_index(self.index, str(index_path))
-        with open(data_path, 'wb') as f:
-            pickle.dump({
-                'documents': self.documents,
-                'metadatas': self.metadatas,
-                'ids': self.ids,
-                'dimension': self.dimension
-            }, f)
+        self._write_index_file(self.index, self._get_index_path())
+        if self.tail_index is not None:
+            self._write_index_file(self.tail_index, self._get_tail_path())
+        self._save_meta_columns()
+        self._write_info()
         print(f"Индекс сохранен в {self.persist_directory}")
     
+    @staticmethod
+    def _write_index_file(index, path: Path):
+        """
+        Записывает FAISS индекс во временный файл с атомарной заменой.
+        
+        Индекс, открытый через mmap в другом процессе, продолжит читать
+        старую версию файла, а прерванная запись не оставит битый файл.
+        """
+        tmp_path = path.with_name(path.name + ".tmp")
+        faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, path)
+    
     def delete_index(self):
         """Удаляет индекс (полезно для очистки данных)."""
         try:
-            index_path = self._get_index_path()
-            data_path = self._get_data_path()
-            if index_path.exists():
-                os.remove(index_path)
-            if data_path.exists():
-                os.remove(data_path)
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            for path in (
+                self._get_index_path(),
+                self._get_tail_path(),
+                self._get_columns_path(),
+                self._get_db_path(),
+                self._get_data_path()
+            ):
+                if path.exists():
+                    os.remove(path)
             self.index = None
-            self.documents = []
-            self.metadatas = []
-            self.ids = []
+            self.tail_index = None
+            self._gpu_index = None
+            self._meta_ids = None
+            self._doc_count = None
+            self._tombstones = set()
             print(f"Индекс '{self.index_name}' удален")
         except Exception as e:
             print(f"Ошибка при удалении индекса: {str(e)}")
@@ -133,38 +891,76 @@ class FAISSClient:
         """
         Создает эмбеддинги с помощью OpenAI API.
         
+        Тексты, уже найденные в кэше, в API не отправляются, а батчи
+        отправляются конкурентно (не более embed_concurrency одновременно).
+        
         Args:
             texts: Список текстов
             
         Returns:
-            Массив векторов эмбеддингов
+            Массив векторов эмбеддингов единичной длины
         """
-        embeddings = []
-        batch_size = 100
+        embeddings = create_embeddings(
+            texts,
+            model=EMBEDDING_MODEL,
+            dimensions=self.dimension,
+            cache=self.embedding_cache,
+            batch_size=self.embed_batch_size,
+            concurrency=self.embed_concurrency
+        )
+        # Эмбеддинги OpenAI почти единичной длины; точная нормализация
+        # превращает скалярное произведение в косинусное сходство
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    @staticmethod
+    def _setup_openai_key(openai_api_key: Optional[str] = None):
+        """Настраивает ключ OpenAI API из аргумента или окружения."""
+        # openai загружается только перед обращением к API
+        import openai
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            
-            try:
-                response = openai.embeddings.create(
-                    input=batch,
-                    model="text-embedding-3-small"
-                )
-                batch_embeddings = [item.embedding for item in response.data]
-                embeddings.extend(batch_embeddings)
-                print(f"Обработано {len(embeddings)}/{len(texts)} текстов...")
-            except Exception as e:
-                print(f"Ошибка при создании эмбеддингов: {str(e)}")
-                raise
+        if openai_api_key:
+            openai.api_key = openai_api_key
+        elif os.getenv("OPENAI_API_KEY"):
+            openai.api_key = os.getenv("OPENAI_API_KEY")
+        else:
+            raise ValueError(
+                "OpenAI API key не найден. "
+                "Установите переменную окружения OPENAI_API_KEY "
+                "или передайте ключ явно"
+            )
+
+    def embed_texts(
+        self,
+        texts: List[str],
+        openai_api_key: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        Создает эмбеддинги для всего списка текстов за один проход.
         
-        return np.array(embeddings, dtype='float32')
+        Все батчи отправляются в API конкурентно, поэтому при загрузке
+        большого корпуса выгоднее посчитать эмбеддинги заранее и передать
+        их в add_documents(embeddings=...) по частям.
+        
+        Args:
+            texts: Список текстов
+            openai_api_key: API ключ OpenAI
+            
+        Returns:
+            Массив нормализованных эмбеддингов (N, dimension)
+        """
+        self._setup_openai_key(openai_api_key)
+        print("Создание эмбеддингов через OpenAI...")
+        return self._create_openai_embeddings(texts)
 
     def add_documents(
         self,
         texts: List[str],
         metadatas: List[Dict],
         ids: Optional[List[str]] = None,
-        openai_api_key: Optional[str] = None
+        openai_api_key: Optional[str] = None,
+        save: bool = True,
+        embeddings: Optional[np.ndarray] = None
     ):
         """
         Добавляет документы в индекс с эмбеддингами от OpenAI.
@@ -174,115 +970,462 @@ class FAISSClient:
             metadatas: Список метаданных для каждого чанка
             ids: Список уникальных идентификаторов
             openai_api_key: API ключ OpenAI
+            save: Сохранить индекс на диск после добавления. При загрузке
+                  несколькими батчами удобно передавать False и вызвать
+                  save_index() один раз в конце
+            embeddings: Готовые эмбеддинги из embed_texts(); если не
+                        переданы, создаются через OpenAI
         """
-        # Настраиваем OpenAI API
-        if openai_api_key:
-            openai.api_key = openai_api_key
-        elif os.getenv("OPENAI_API_KEY"):
-            openai.api_key = os.getenv("OPENAI_API_KEY")
-        else:
-            raise ValueError(
-                "OpenAI API key не найден. "
-                "Установите переменную окружения OPENAI_API_KEY "
-                "или передайте ключ явно"
-            )
+        if embeddings is None:
+            self._setup_openai_key(openai_api_key)
         
         # Генерируем ID, если они не предоставлены
         if ids is None:
             ids = [f"doc_{i}" for i in range(len(texts))]
         
         try:
-            # Создаем эмбеддинги через OpenAI
-            print("Создание эмбеддингов через OpenAI...")
-            embeddings = self._create_openai_embeddings(texts)
+            if embeddings is None:
+                embeddings = self.embed_texts(texts, openai_api_key)
+            else:
+                embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+                if embeddings.shape[0] != len(texts):
+                    raise ValueError(
+                        f"Количество эмбеддингов ({embeddings.shape[0]}) "
+                        f"не совпадает с количеством текстов ({len(texts)})"
+                    )
             
             # Создаем индекс если не существует
+            self._ensure_writable()
             if self.index is None:
-                self.create_index(dimension=embeddings.shape[1])
+                self.create_index(
+                    dimension=embeddings.shape[1],
+                    n_train=embeddings.shape[0]
+                )
+            
+            int_ids = [self._to_int_id(doc_id) for doc_id in ids]
             
-            # Добавляем векторы в индекс
-            self.index.add(embeddings)
+            # Повторное добавление документа с тем же ID заменяет старую версию
+            existing = self._existing_ids(ids)
+            if existing:
+                self._remove_vectors(existing)
             
-            # Сохраняем документы и метаданные
-            self.documents.extend(texts)
-            self.metadatas.extend(metadatas)
-            self.ids.extend(ids)
+            # Добавляем векторы вместе с их ID: в хвост, если он есть,
+            # иначе сразу в основной индекс
+            int_ids_array = np.array(int_ids, dtype='int64')
+            if self.tail_index is not None:
+                self.tail_index.add_with_ids(embeddings, int_ids_array)
+                if self.tail_index.ntotal >= self.tail_size:
+                    self._merge_tail()
+            else:
+                self.index.add_with_ids(embeddings, int_ids_array)
+                self._gpu_index = None
             
-            # Сохраняем на диск
-            self.save_index()
+            # Сохраняем документы и метаданные одной транзакцией
+            db = self._get_db()
+            with db:
+                self._mark_columns_stale(db)
+                db.executemany(
+                    "INSERT OR REPLACE INTO documents (id, doc_id, text, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (int_id, doc_id, text, json.dumps(metadata, ensure_ascii=False))
+                        for int_id, doc_id, text, metadata in zip(int_ids, ids, texts, metadatas)
+                    ]
+                )
+            self._doc_count = None
+            self._append_meta_columns(int_ids, metadatas)
+            
+            # Сохраняем индекс на диск
+            if save:
+                self.save_index()
             
             print(f"Добавлено {len(texts)} документов в индекс")
         except Exception as e:
             raise Exception(f"Ошибка при добавлении документов: {str(e)}")
     
-    def search(
+    def _merge_tail(self):
+        """
+        Переносит векторы из хвоста в основной индекс и очищает хвост.
+        
+        Индексы IVF и квантованные индексы обучаются при первом переносе,
+        поэтому число кластеров подбирается под накопленную порцию векторов.
+        """
+        # Иначе в основном индексе окажутся два вектора с одним ID:
+        # устаревший и новый
+        if self._tombstones:
+            self._compact_index()
+        
+        n = self.tail_index.ntotal
+        vectors = self.tail_index.index.reconstruct_n(0, n)
+        tail_ids = faiss.vector_to_array(self.tail_index.id_map).copy()
+        
+        # IVF и квантованные индексы требуют обучения перед первым
+        # добавлением векторов (кластеры, кодовые книги, диапазоны int8)
+        if not self.index.is_trained:
+            min_train = 2 ** PQ_NBITS if self.index_type == 'ivfpq' else 1
+            if n < min_train:
+                raise ValueError(
+                    f"Для обучения индекса {self.index_type} нужно минимум "
+                    f"{min_train} векторов, получено {n}. "
+                    f"Используйте index_type='hnsw' или 'flat'"
+                )
+            self.index = self._build_index(self.dimension, n_train=n)
+            print(f"Обучение индекса {self.index_type}...")
+            self._train_index(vectors)
+        
+        print(f"Перенос {n} векторов в индекс {self.index_type}...")
+        self.index.add_with_ids(vectors, tail_ids)
+        self.tail_index.reset()
+        self._gpu_index = None
+    
+    def _compact_index(self):
+        """
+        Перестраивает основной индекс без устаревших векторов (self._tombstones).
+        
+        Векторы восстанавливаются из самого индекса, без обращения к OpenAI.
+        Перестройка графа HNSW занимает время, пропорциональное размеру
+        индекса, поэтому выполняется не при каждом удалении, а при
+        сохранении индекса и перед переносом хвоста.
+        """
+        ids = faiss.vector_to_array(self.index.id_map)
+        keep = ~np.isin(ids, np.fromiter(self._tombstones, dtype='int64'))
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)[keep]
+        
+        print(f"Перестройка индекса {self.index_type}: удаляется "
+              f"{len(self._tombstones)} устаревших векторов...")
+        self.index = self._build_index(self.dimension, n_train=len(vectors))
+        if not self.index.is_trained:
+            self._train_index(vectors)
+        if len(vectors):
+            self.index.add_with_ids(vectors, ids[keep])
+        self._tombstones = set()
+        self._gpu_index = None
+    
+    def _unwrap_ivf(self):
+        """
+        Переводит IndexIDMap2 поверх IVF (так индексы сохранялись раньше)
+        в IVF-индекс, который сам хранит ID документов.
+        
+        В инвертированных списках порядковые номера векторов заменяются
+        на ID из id_map; коды векторов не пересчитываются.
+        """
+        if not isinstance(self.index, faiss.IndexIDMap2):
+            return
+        inner = faiss.clone_index(self.index.index)
+        ivf = faiss.try_extract_index_ivf(inner)
+        if ivf is None:
+            return
+        
+        id_map = faiss.vector_to_array(self.index.id_map)
+        invlists = ivf.invlists
+        for list_no in range(ivf.nlist):
+            size = invlists.list_size(list_no)
+            if size:
+                ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+                ids[:] = id_map[ids]
+        self.index = self._apply_search_params(inner)
+        self._gpu_index = None
+    
+    def _remove_vectors(self, int_ids: List[int]):
+        """Удаляет векторы и связанные с ними данные по int64 ID."""
+        ids_array = np.array(int_ids, dtype='int64')
+        removed = 0
+        if self.tail_index is not None:
+            removed = self.tail_index.remove_ids(ids_array)
+        
+        # Недавно добавленные документы целиком лежат в хвосте
+        if removed < len(int_ids):
+            self._unwrap_ivf()
+            try:
+                self.index.remove_ids(ids_array)
+            except RuntimeError:
+                # Граф HNSW не поддерживает удаление вершин: векторы
+                # помечаются устаревшими до перестройки индекса
+                in_main = np.isin(ids_array, faiss.vector_to_array(self.index.id_map))
+                self._tombstones.update(ids_array[in_main].tolist())
+                if self.tail_index is None:
+                    self._compact_index()
+        self._gpu_index = None
+        
+        db = self._get_db()
+        with db:
+            self._mark_columns_stale(db)
+            for i in range(0, len(int_ids), SQLITE_MAX_VARS):
+                batch = int_ids[i:i + SQLITE_MAX_VARS]
+                placeholders = ",".join("?" * len(batch))
+                db.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", batch)
+        self._doc_count = None
+        self._drop_meta_rows(int_ids)
+    
+    def delete_documents(self, ids: List[str]):
+        """
+        Удаляет документы из индекса.
+        
+        Индексы, которые поддерживают remove_ids, не перестраиваются.
+        Граф HNSW удаление не поддерживает и перестраивается при сохранении.
+        
+        Args:
+            ids: Список строковых ID документов
+        """
+        if self.index is None:
+            raise Exception("Индекс не создан")
+        
+        self._ensure_writable()
+        int_ids = self._existing_ids(ids)
+        if not int_ids:
+            return
+        
+        self._remove_vectors(int_ids)
+        self.save_index()
+        print(f"Удалено {len(int_ids)} документов из индекса")
+    
+    def embed_query(
         self,
         query: str,
+        openai_api_key: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        Создает нормализованный эмбеддинг поискового запроса.
+        
+        Args:
+            query: Поисковый запрос
+            openai_api_key: API ключ OpenAI
+            
+        Returns:
+            Вектор формы (dimension,)
+        """
+        self._setup_openai_key(openai_api_key)
+        return self._query_embedding_lru(query.strip())
+    
+    def _embed_query_uncached(self, query: str) -> np.ndarray:
+        embedding = self._create_openai_embeddings([query])[0]
+        # Один и тот же массив возвращается из LRU многократно
+        embedding.flags.writeable = False
+        return embedding
+    
+    def query_cache_info(self):
+        """Статистика LRU-кэша эмбеддингов запросов (hits, misses, currsize)."""
+        return self._query_embedding_lru.cache_info()
+    
+    def index_version(self) -> str:
+        """
+        Возвращает строку, которая меняется при каждом сохранении индекса.
+        
+        Нужна для кэшей результатов поиска: после переиндексации
+        сохраненные результаты становятся недействительными.
+        """
+        index_path = self._get_index_path()
+        mtime = index_path.stat().st_mtime_ns if index_path.exists() else 0
+        return f"{self.index_name}:{self._vector_count()}:{mtime}"
+    
+    def search(
+        self,
+        query: Optional[str] = None,
         n_results: int = 5,
         where: Optional[Dict] = None,
-        openai_api_key: Optional[str] = None
+        openai_api_key: Optional[str] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        oversample: int = FILTER_OVERFETCH
     ) -> Dict:
         """
         Выполняет семантический поиск по индексу.
         
         Args:
-            query: Поисковый запрос
+            query: Поисковый запрос (не нужен, если передан query_embedding)
             n_results: Количество результатов для возврата
             where: Фильтр по метаданным (например, {"type": "txt"})
             openai_api_key: API ключ OpenAI
+            query_embedding: Готовый эмбеддинг запроса из embed_query();
+                             если передан, OpenAI не вызывается
+            oversample: Во сколько раз больше кандидатов запрашивать у FAISS
+                        при фильтре where
             
         Returns:
             Словарь с результатами поиска
         """
-        if self.index is None or self.index.ntotal == 0:
+        if self.index is None or self._vector_count() == 0:
             raise Exception("Индекс пуст или не загружен")
         
-        # Настраиваем OpenAI API
-        if openai_api_key:
-            openai.api_key = openai_api_key
-        elif os.getenv("OPENAI_API_KEY"):
-            openai.api_key = os.getenv("OPENAI_API_KEY")
-        else:
-            raise ValueError("OpenAI API key не найден")
+        if query_embedding is None:
+            if query is None:
+                raise ValueError("Нужно указать query или query_embedding")
+            self._setup_openai_key(openai_api_key)
+        
+        try:
+            if query_embedding is None:
+                query_embedding = self._query_embedding_lru(query.strip())
+            # FAISS принимает только непрерывный float32: список или срез
+            # приводится здесь один раз, а готовый массив не копируется
+            query_embeddings = np.ascontiguousarray(query_embedding, dtype='float32').reshape(1, -1)
+            return self._search_vectors(query_embeddings, n_results, where, oversample)
+        except Exception as e:
+            raise Exception(f"Ошибка при поиске: {str(e)}")
+    
+    def search_batch(
+        self,
+        queries: Optional[List[str]] = None,
+        n_results: int = 5,
+        where: Optional[Dict] = None,
+        openai_api_key: Optional[str] = None,
+        query_embeddings: Optional[np.ndarray] = None,
+        oversample: int = FILTER_OVERFETCH
+    ) -> Dict:
+        """
+        Выполняет семантический поиск сразу по нескольким запросам.
+        
+        Эмбеддинги всех запросов создаются одним обращением к OpenAI, а FAISS
+        обрабатывает их одним вызовом index.search (умножение матриц вместо
+        отдельного прохода по индексу на каждый запрос).
+        
+        Args:
+            queries: Список поисковых запросов (не нужен, если переданы
+                     query_embeddings)
+            n_results: Количество результатов для каждого запроса
+            where: Фильтр по метаданным (например, {"type": "txt"})
+            openai_api_key: API ключ OpenAI
+            query_embeddings: Готовые эмбеддинги запросов (nq, dimension);
+                              если переданы, OpenAI не вызывается
+            oversample: Во сколько раз больше кандидатов запрашивать у FAISS
+                        при фильтре where
+            
+        Returns:
+            Словарь с результатами поиска: по одному списку на каждый запрос
+        """
+        if self.index is None or self._vector_count() == 0:
+            raise Exception("Индекс пуст или не загружен")
+        
+        if query_embeddings is None:
+            if queries is None:
+                raise ValueError("Нужно указать queries или query_embeddings")
+            self._setup_openai_key(openai_api_key)
         
         try:
-            # Создаем эмбеддинг для запроса
-            query_embedding = self._create_openai_embeddings([query])
+            if query_embeddings is None:
+                query_embeddings = self._create_openai_embeddings(queries)
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+            return self._search_vectors(query_embeddings, n_results, where, oversample)
+        except Exception as e:
+            raise Exception(f"Ошибка при поиске: {str(e)}")
+    
+    def _search_vectors(
+        self,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        where: Optional[Dict] = None,
+        oversample: int = FILTER_OVERFETCH
+    ) -> Dict:
+        """
+        Ищет ближайшие документы для матрицы эмбеддингов запросов.
+        
+        Args:
+            query_embeddings: Эмбеддинги запросов, shape (nq, dimension)
+            n_results: Количество результатов для каждого запроса
+            where: Фильтр по метаданным
+            oversample: Запас кандидатов при фильтре (множитель к n_results)
             
-            # Выполняем поиск
-            distances, indices = self.index.search(query_embedding, min(n_results * 2, self.index.ntotal))
+        Returns:
+            Словарь с результатами поиска: по одному списку на каждый запрос
+        """
+        # Поиск идет по основному индексу и по хвосту: у каждого из них
+        # свой top-k, которые затем объединяются по расстоянию
+        parts = []
+        if self.index.ntotal > 0:
+            parts.append((self.index, self._get_search_index()))
+        if self.tail_index is not None and self.tail_index.ntotal > 0:
+            parts.append((self.tail_index, self.tail_index))
+        ntotal = sum(index_part.ntotal for index_part, _ in parts)
+        
+        # ANN-индекс уже возвращает упорядоченный top-k, поэтому запас
+        # кандидатов нужен только для последующей фильтрации по метаданным
+        n_candidates = n_results
+        if where:
+            n_candidates = max(n_results * max(1, oversample), FILTER_MIN_CANDIDATES)
+        
+        while True:
+            n_candidates = min(n_candidates, ntotal)
+            distances, labels = self._search_parts(parts, query_embeddings, n_candidates)
+            
+            # Фильтр по метаданным считается одной векторной операцией
+            # по столбцам сразу для всех запросов
+            mask = labels != -1
+            if not where:
+                break
+            mask &= self._where_mask(labels.ravel(), where).reshape(labels.shape)
             
-            # Фильтруем результаты
+            # Избирательный фильтр мог оставить меньше n_results документов
+            if n_candidates >= ntotal or (mask.sum(axis=1) >= n_results).all():
+                break
+            n_candidates *= 2
+        
+        # Кандидаты уже отсортированы по расстоянию, поэтому top-k после
+        # фильтра - это первые n_results позиций маски, без сортировки в Python
+        selected = [np.flatnonzero(row_mask)[:n_results] for row_mask in mask]
+        
+        # FAISS возвращает сохраненные int64 ID, а не порядковые номера.
+        # Из SQLite читаются только итоговые результаты всех запросов
+        records = self._fetch_records(list({
+            int(int_id) for row, positions in zip(labels, selected)
+            for int_id in row[positions]
+        }))
+        
+        results = {'documents': [], 'metadatas': [], 'distances': []}
+        for row_labels, row_distances, positions in zip(labels, distances, selected):
             documents = []
             metadatas_result = []
             distances_result = []
-            
-            for dist, idx in zip(distances[0], indices[0]):
-                if idx == -1:
+            for position in positions:
+                record = records.get(int(row_labels[position]))
+                if record is None:
                     continue
-                
-                metadata = self.metadatas[idx]
-                
-                # Применяем фильтр если указан
-                if where:
-                    match = all(metadata.get(k) == v for k, v in where.items())
-                    if not match:
-                        continue
-                
-                documents.append(self.documents[idx])
+                _, text, metadata = record
+                documents.append(text)
                 metadatas_result.append(metadata)
-                distances_result.append(float(dist))
-                
-                if len(documents) >= n_results:
-                    break
+                distances_result.append(float(row_distances[position]))
             
-            return {
-                'documents': [documents],
-                'metadatas': [metadatas_result],
-                'distances': [distances_result]
-            }
-        except Exception as e:
-            raise Exception(f"Ошибка при поиске: {str(e)}")
+            results['documents'].append(documents)
+            results['metadatas'].append(metadatas_result)
+            results['distances'].append(distances_result)
+        return results
+    
+    def _search_parts(self, parts, query_embeddings: np.ndarray, k: int):
+        """
+        Ищет top-k в нескольких индексах и объединяет результаты.
+        
+        Returns:
+            (расстояния, int64 ID), отсортированные по возрастанию расстояния
+        """
+        all_distances = []
+        all_labels = []
+        for index_part, search_index in parts:
+            # Устаревшие векторы основного индекса могут занять часть top-k,
+            # поэтому у него запрашивается на столько же больше кандидатов
+            stale = self._tombstones if index_part is self.index else None
+            k_part = k + len(stale) if stale else k
+            distances, labels = search_index.search(
+                query_embeddings, min(k_part, index_part.ntotal)
+            )
+            # Для индексов со скалярным произведением FAISS возвращает сходство.
+            # Переводим его в косинусное расстояние, чтобы, как и раньше,
+            # меньшее значение означало более похожий документ.
+            # Индексы старого формата (L2) возвращают расстояние как есть
+            if index_part.metric_type == faiss.METRIC_INNER_PRODUCT:
+                distances = 1.0 - distances
+            if stale:
+                hidden = np.isin(labels, np.fromiter(stale, dtype='int64'))
+                labels = np.where(hidden, -1, labels)
+                distances = np.where(hidden, np.inf, distances)
+            all_distances.append(distances)
+            all_labels.append(labels)
+        
+        if len(parts) == 1:
+            return all_distances[0], all_labels[0]
+        
+        distances = np.hstack(all_distances)
+        labels = np.hstack(all_labels)
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return (
+            np.take_along_axis(distances, order, axis=1),
+            np.take_along_axis(labels, order, axis=1)
+        )
     
     def get_index_stats(self) -> Dict:
         """
@@ -296,9 +1439,10 @@ class FAISSClient:
         
         return {
             "name": self.index_name,
-            "document_count": len(self.documents),
-            "vector_count": self.index.ntotal,
-            "dimension": self.dimension
+            "document_count": self._count_documents(),
+            "vector_count": self._vector_count(),
+            "dimension": self.dimension,
+            "index_type": self.index_type
         }
 
 
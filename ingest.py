@@ -14,107 +14,398 @@
     python ingest.py --files data/sample.txt data/sample.html
 """
 
+import hashlib
 import os
+import queue
 import sys
-from pathlib import Path
-from typing import List, Dict
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Dict, Optional
 import argparse
 
 from loader.txt_loader import load_txt
 from loader.html_loader import load_html
 from loader.chunker import create_chunks_with_metadata
-from faiss_store.faiss_client import FAISSClient
+from faiss_store.faiss_client import FAISSClient, INDEX_TYPES
 
 
-def load_document(file_path: str) -> tuple[str, str]:
-    """Загружает документ в зависимости от его типа."""
-    file_ext = Path(file_path).suffix.lower()
+# Загрузчик и тип документа для каждого поддерживаемого расширения
+_LOADERS = {
+    '.txt': (load_txt, 'txt'),
+    '.html': (load_html, 'html'),
+    '.htm': (load_html, 'html'),
+}
+
+# Расширения файлов, которые умеет загружать load_document
+SUPPORTED_EXTENSIONS = frozenset(_LOADERS)
+
+# Директория для очищенного текста уже разобранных файлов
+INGEST_CACHE_DIR = "./.ingest_cache"
+
+
+def load_document(
+    file_path: str,
+    cache_dir: Optional[str] = None
+) -> tuple[str, str]:
+    """
+    Загружает документ в зависимости от его типа.
     
-    print(f"Загрузка файла: {file_path}")
+    Если указан cache_dir, очищенный текст сохраняется в кэш с ключом из
+    пути, времени изменения и размера файла; при повторном запуске
+    неизмененные файлы заново не разбираются.
     
-    if file_ext == '.txt':
-        text = load_txt(file_path)
-        return text, 'txt'
-    elif file_ext in ['.html', '.htm']:
-        text = load_html(file_path)
-        return text, 'html'
-    else:
+    Args:
+        file_path: Путь к файлу
+        cache_dir: Директория кэша (None - без кэша)
+        
+    Returns:
+        Текст документа и его тип
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+    
+    try:
+        loader, doc_type = _LOADERS[file_ext]
+    except KeyError:
         raise ValueError(f"Неподдерживаемый формат файла: {file_ext}")
+    
+    if cache_dir is None:
+        return loader(file_path), doc_type
+    
+    stat = os.stat(file_path)
+    key = hashlib.blake2b(
+        f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}".encode('utf-8')
+    ).hexdigest()
+    cache_path = os.path.join(cache_dir, key + '.txt')
+    
+    try:
+        with open(cache_path, 'r', encoding='utf-8', newline='') as f:
+            return f.read(), doc_type
+    except FileNotFoundError:
+        pass
+    
+    text = loader(file_path)
+    
+    # Пишем во временный файл и атомарно переименовываем, чтобы прерванная
+    # запись не оставила в кэше обрезанный текст
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"  ⚠️ Не удалось сохранить кэш для {file_path}: {str(e)}")
+    
+    return text, doc_type
+
+
+def _load_and_chunk(
+    file_path: str,
+    chunk_size: int,
+    overlap: int,
+    cache_dir: Optional[str] = None
+) -> tuple[int, List[Dict]]:
+    """
+    Загружает один документ и разбивает его на чанки.
+    
+    Функция объявлена на уровне модуля, чтобы ее можно было выполнять
+    в дочерних процессах ProcessPoolExecutor.
+    
+    Returns:
+        Длина текста документа и список чанков с метаданными
+    """
+    text, doc_type = load_document(file_path, cache_dir)
+    chunks_with_meta = _chunk_document(
+        file_path, text, doc_type, chunk_size, overlap
+    )
+    return len(text), chunks_with_meta
 
 
-def process_documents(
+def _chunk_document(
+    file_path: str,
+    text: str,
+    doc_type: str,
+    chunk_size: int,
+    overlap: int
+) -> List[Dict]:
+    """Разбивает загруженный документ на чанки с метаданными."""
+    return create_chunks_with_metadata(
+        text=text,
+        chunk_size=chunk_size,
+        overlap=overlap,
+        source=os.path.basename(file_path),
+        doc_type=doc_type
+    )
+
+
+def _iter_pipelined(
     file_paths: List[str],
-    chunk_size: int = 500,
-    overlap: int = 100
-) -> tuple[List[str], List[Dict], List[str]]:
-    """Обрабатывает список документов: загружает и разбивает на чанки."""
-    all_chunks = []
-    all_metadatas = []
-    all_ids = []
-    doc_counter = 0
+    chunk_size: int,
+    overlap: int,
+    cache_dir: Optional[str] = None,
+    prefetch: int = 4
+):
+    """
+    Загружает и чанкует файлы конвейером в одном процессе.
+    
+    Фоновый поток читает файлы и кладет (путь, текст, тип) в очередь
+    ограниченного размера, а основной поток тем временем разбивает на чанки
+    уже прочитанные документы. Конец очереди обозначается значением None.
     
-    for file_path in file_paths:
+    Yields:
+        Путь к файлу и результат (длина текста, чанки) либо исключение
+    """
+    loaded = queue.Queue(maxsize=prefetch)
+    
+    def reader():
+        for file_path in file_paths:
+            try:
+                text, doc_type = load_document(file_path, cache_dir)
+                loaded.put((file_path, text, doc_type, None))
+            except Exception as e:
+                loaded.put((file_path, None, None, e))
+        loaded.put(None)
+    
+    threading.Thread(target=reader, daemon=True).start()
+    
+    while (item := loaded.get()) is not None:
+        file_path, text, doc_type, error = item
+        if error is not None:
+            yield file_path, error
+            continue
         try:
-            text, doc_type = load_document(file_path)
-            print(f"  Загружено {len(text)} символов")
-            
-            chunks_with_meta = create_chunks_with_metadata(
-                text=text,
-                chunk_size=chunk_size,
-                overlap=overlap,
-                source=Path(file_path).name,
-                doc_type=doc_type
+            chunks_with_meta = _chunk_document(
+                file_path, text, doc_type, chunk_size, overlap
             )
+            yield file_path, (len(text), chunks_with_meta)
+        except Exception as e:
+            yield file_path, e
+
+
+def _iter_parallel(
+    file_paths: List[str],
+    chunk_size: int,
+    overlap: int,
+    workers: int,
+    cache_dir: Optional[str] = None
+):
+    """
+    Загружает и чанкует файлы параллельно в нескольких процессах.
+    
+    В работе одновременно не больше 2 * workers файлов, поэтому готовые
+    чанки не накапливаются в памяти, пока потребитель занят загрузкой
+    предыдущих батчей в индекс.
+    
+    Yields:
+        Путь к файлу и результат (длина текста, чанки) либо исключение
+        в порядке отправки файлов
+    """
+    pending = deque()
+    paths = iter(file_paths)
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_path in paths:
+            pending.append((
+                file_path,
+                executor.submit(
+                    _load_and_chunk, file_path, chunk_size, overlap, cache_dir
+                )
+            ))
+            if len(pending) >= 2 * workers:
+                break
+        
+        while pending:
+            file_path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((
+                    next_path,
+                    executor.submit(
+                        _load_and_chunk, next_path, chunk_size, overlap, cache_dir
+                    )
+                ))
+            try:
+                yield file_path, future.result()
+            except Exception as e:
+                yield file_path, e
+
+
+def iter_document_batches(
+    file_paths: List[str],
+    chunk_size: int = 500,
+    overlap: int = 100,
+    batch_size: int = 200,
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = INGEST_CACHE_DIR
+) -> Iterator[tuple[List[str], List[Dict], List[str]]]:
+    """
+    Обрабатывает список документов: загружает, разбивает на чанки и
+    отдает их батчами.
+    
+    Чанки всего корпуса не собираются в памяти: наружу по мере готовности
+    выдаются батчи не больше batch_size, которые можно сразу добавлять
+    в индекс.
+    
+    Повторяющиеся чанки (колонтитулы, шаблонные блоки) распознаются по
+    хэшу текста: в метаданные дубликата записывается dup_of - ID первого
+    чанка с тем же текстом. Эмбеддинг такого текста запрашивается у OpenAI
+    один раз и переиспользуется через кэш эмбеддингов.
+    
+    Разбор HTML и чанкинг занимают процессор и не зависят друг от друга,
+    поэтому файлы обрабатываются параллельно в нескольких процессах.
+    С одним процессом чтение файлов выполняется в фоновом потоке
+    параллельно с чанкингом.
+    
+    Args:
+        file_paths: Список путей к файлам
+        chunk_size: Размер чанка в символах
+        overlap: Перекрытие между чанками
+        batch_size: Максимальное количество чанков в батче
+        workers: Число процессов (по умолчанию - число ядер)
+        cache_dir: Директория кэша очищенного текста (None - без кэша)
+        
+    Yields:
+        Кортежи (тексты, метаданные, ID) для очередного батча
+    """
+    texts = []
+    metadatas = []
+    ids = []
+    doc_counter = 0
+    # Хэш текста чанка -> ID его первого вхождения
+    seen = {}
+    duplicates = 0
+    
+    # Файлы обрабатываются в отсортированном порядке, а результаты
+    # собираются в порядке отправки: ID чанков не зависят от того,
+    # какой процесс закончил работу раньше
+    file_paths = sorted(file_paths)
+    workers = min(workers or os.cpu_count() or 1, len(file_paths)) or 1
+    
+    if workers == 1:
+        results = _iter_pipelined(file_paths, chunk_size, overlap, cache_dir)
+    else:
+        results = _iter_parallel(
+            file_paths, chunk_size, overlap, workers, cache_dir
+        )
+    
+    for file_path, result in results:
+        print(f"Загрузка файла: {file_path}")
+        if isinstance(result, Exception):
+            print(f"  ✗ Ошибка при обработке файла: {str(result)}\n")
+            continue
+        
+        text_length, chunks_with_meta = result
+        print(f"  Загружено {text_length} символов")
+        print(f"  Создано {len(chunks_with_meta)} чанков")
+        
+        for chunk_data in chunks_with_meta:
+            text = chunk_data['text']
+            metadata = chunk_data['metadata']
+            chunk_id = f"doc_{doc_counter}_chunk_{metadata['chunk_id']}"
             
-            print(f"  Создано {len(chunks_with_meta)} чанков")
-            
-            for chunk_data in chunks_with_meta:
-                all_chunks.append(chunk_data['text'])
-                all_metadatas.append(chunk_data['metadata'])
-                chunk_id = f"doc_{doc_counter}_chunk_{chunk_data['metadata']['chunk_id']}"
-                all_ids.append(chunk_id)
+            digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+            first_id = seen.setdefault(digest, chunk_id)
+            if first_id != chunk_id:
+                metadata['dup_of'] = first_id
+                duplicates += 1
             
-            doc_counter += 1
-            print(f"  ✓ Файл обработан успешно\n")
+            texts.append(text)
+            metadatas.append(metadata)
+            ids.append(chunk_id)
             
-        except Exception as e:
-            print(f"  ✗ Ошибка при обработке файла: {str(e)}\n")
-            continue
+            if len(texts) >= batch_size:
+                yield texts, metadatas, ids
+                texts, metadatas, ids = [], [], []
+        
+        doc_counter += 1
+        print(f"  ✓ Файл обработан успешно\n")
     
-    return all_chunks, all_metadatas, all_ids
+    if duplicates:
+        print(f"Повторяющихся чанков: {duplicates}\n")
+    
+    if texts:
+        yield texts, metadatas, ids
 
 
 def ingest_to_faiss(
-    texts: List[str],
-    metadatas: List[Dict],
-    ids: List[str],
+    batches: Iterable[tuple[List[str], List[Dict], List[str]]],
     openai_api_key: str = None,
     persist_directory: str = "./faiss_db",
-    index_name: str = "documents"
-):
-    """Загружает данные в FAISS."""
+    index_name: str = "documents",
+    embed_concurrency: int = 8,
+    index_type: str = "hnsw",
+    index_factory: Optional[str] = None
+) -> int:
+    """
+    Загружает данные в FAISS.
+    
+    Батчи из iter_document_batches добавляются в индекс по мере их
+    появления. Мелкие батчи склеиваются так, чтобы в одном вызове
+    add_documents было не меньше embed_batch_size * embed_concurrency
+    чанков: тогда эмбеддинги запрашиваются у OpenAI действительно
+    конкурентно (embed_concurrency запросов одновременно). Индекс
+    сохраняется на диск один раз в конце.
+    
+    Тип индекса (index_type или строка index_factory) сохраняется вместе
+    с ним; search.py читает его при загрузке.
+    
+    Returns:
+        Количество добавленных чанков
+    """
     print("=" * 60)
     print("Инициализация FAISS...")
     print("=" * 60)
     
     client = FAISSClient(
         persist_directory=persist_directory,
-        index_name=index_name
+        index_name=index_name,
+        index_type=index_type,
+        index_factory=index_factory,
+        embed_concurrency=embed_concurrency
     )
     
     print("\n" + "=" * 60)
     print("Добавление документов в FAISS...")
     print("=" * 60)
     
-    try:
+    # Столько чанков занимают все конкурентные запросы к OpenAI сразу
+    window = client.embed_batch_size * client.embed_concurrency
+    texts, metadatas, ids = [], [], []
+    batch_num = 0
+    total = 0
+    
+    def flush():
+        nonlocal texts, metadatas, ids, batch_num, total
+        batch_num += 1
+        print(f"\nБатч {batch_num} ({len(texts)} чанков)")
         client.add_documents(
             texts=texts,
             metadatas=metadatas,
             ids=ids,
-            openai_api_key=openai_api_key
+            openai_api_key=openai_api_key,
+            save=False
         )
+        total += len(texts)
+        texts, metadatas, ids = [], [], []
+    
+    try:
+        for batch_texts, batch_metadatas, batch_ids in batches:
+            texts += batch_texts
+            metadatas += batch_metadatas
+            ids += batch_ids
+            if len(texts) >= window:
+                flush()
+        if texts:
+            flush()
+        
+        if total == 0:
+            return 0
+        
+        client.save_index()
         
         print("\n✓ Все документы успешно добавлены!")
+        print(f"Всего обработано чанков: {total}")
         
         stats = client.get_index_stats()
         print("\n" + "=" * 60)
@@ -126,11 +417,21 @@ def ingest_to_faiss(
     except Exception as e:
         print(f"\n✗ Ошибка при добавлении документов: {str(e)}")
         sys.exit(1)
+    
+    return total
 
 
-def main():
-    """Основная функция скрипта."""
-    parser = argparse.ArgumentParser(
+# Парсер аргументов строится один раз, при первом обращении
+_PARSER = None
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    """Возвращает парсер аргументов командной строки (создается один раз)."""
+    global _PARSER
+    if _PARSER is not None:
+        return _PARSER
+    
+    _PARSER = parser = argparse.ArgumentParser(
         description="Загрузка документов в FAISS для RAG"
     )
     parser.add_argument(
@@ -161,21 +462,71 @@ def main():
         default='documents',
         help='Имя индекса FAISS (по умолчанию: documents)'
     )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=200,
+        help='Количество чанков в батче, выдаваемом при чтении файлов; батчи '
+             'склеиваются до embed-concurrency запросов к OpenAI (по умолчанию: 200)'
+    )
+    parser.add_argument(
+        '--embed-concurrency',
+        type=int,
+        default=8,
+        help='Максимум одновременных запросов к OpenAI за эмбеддингами (по умолчанию: 8)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help=f'Не использовать кэш разобранных файлов ({INGEST_CACHE_DIR})'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Число процессов для загрузки и чанкинга (по умолчанию: число ядер)'
+    )
+    parser.add_argument(
+        '--index-type',
+        choices=INDEX_TYPES,
+        default='hnsw',
+        help='Тип индекса FAISS (по умолчанию: hnsw); для больших корпусов - ivfpq'
+    )
+    parser.add_argument(
+        '--index-factory',
+        type=str,
+        default=None,
+        help='Строка faiss.index_factory, например "IVF4096,PQ64" (вместо --index-type)'
+    )
     
+    return _PARSER
+
+
+def main():
+    """Основная функция скрипта."""
+    parser = _get_parser()
     args = parser.parse_args()
     
+    if args.chunk_size <= 0:
+        parser.error("--chunk-size должен быть больше 0")
+    if not 0 <= args.overlap < args.chunk_size:
+        parser.error("--overlap должен быть неотрицательным и меньше --chunk-size")
+    
     if args.files:
         file_paths = args.files
     else:
-        data_dir = Path(__file__).parent / 'data'
-        if not data_dir.exists():
+        data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        if not os.path.isdir(data_dir):
             print(f"✗ Директория {data_dir} не найдена!")
             sys.exit(1)
         
-        file_paths = [
-            str(f) for f in data_dir.iterdir() 
-            if f.suffix.lower() in ['.txt', '.html', '.htm']
-        ]
+        # DirEntry кэширует имя и тип файла, лишних stat() не делается
+        with os.scandir(data_dir) as entries:
+            file_paths = [
+                entry.path for entry in entries
+                if entry.is_file()
+                and os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS
+            ]
     
     if not file_paths:
         print("✗ Не найдено файлов для обработки!")
@@ -191,26 +542,28 @@ def main():
     print("=" * 60)
     print()
     
-    texts, metadatas, ids = process_documents(
+    batches = iter_document_batches(
         file_paths=file_paths,
         chunk_size=args.chunk_size,
-        overlap=args.overlap
+        overlap=args.overlap,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        cache_dir=None if args.no_cache else INGEST_CACHE_DIR
     )
     
-    if not texts:
-        print("✗ Не удалось обработать ни одного документа!")
-        sys.exit(1)
-    
-    print(f"Всего обработано чанков: {len(texts)}\n")
-    
-    ingest_to_faiss(
-        texts=texts,
-        metadatas=metadatas,
-        ids=ids,
+    total = ingest_to_faiss(
+        batches=batches,
         openai_api_key=args.openai_key,
-        index_name=args.index
+        index_name=args.index,
+        embed_concurrency=args.embed_concurrency,
+        index_type=args.index_type,
+        index_factory=args.index_factory
     )
     
+    if total == 0:
+        print("✗ Не удалось обработать ни одного документа!")
+        sys.exit(1)
+    
     print("\n" + "=" * 60)
     print("ЗАГРУЗКА ЗАВЕРШЕНА!")
     print("=" * 60)
@@ -0,0 +1,13 @@
+"""
+Скомпилированные регулярные выражения, общие для загрузчиков.
+"""
+
+import re
+
+# Два и более пробела подряд (одиночные пробелы совпадением не считаются,
+# поэтому не копируются при замене)
+SPACES_RE = re.compile(r' {2,}')
+
+# Перенос строки вместе с пробельными символами вокруг него, включая пустые
+# строки: замена на '\n' обрезает края строк и удаляет пустые строки за один проход
+LINE_BREAKS_RE = re.compile(r'\s*\n\s*')
@@ -46,25 +46,10 @@ def chunk_text(
     if len(text) <= chunk_size:
         return [text]
     
-    chunks = []
-    start = 0
-    
-    # Разбиваем текст на чанки с перекрытием
-    while start < len(text):
-        # Определяем конец текущего чанка
-        end = start + chunk_size
-        
-        # Извлекаем чанк
-        chunk = text[start:end]
-        
-        # Добавляем чанк в список
-        chunks.append(chunk)
-        
-        # Сдвигаем начало для следующего чанка
-        # Используем (chunk_size - overlap) чтобы создать перекрытие
-        start += (chunk_size - overlap)
-    
-    return chunks
+    # Начала чанков идут с шагом (chunk_size - overlap), что и создает
+    # перекрытие; сами чанки - срезы исходной строки
+    step = chunk_size - overlap
+    return [text[start:start + chunk_size] for start in range(0, len(text), step)]
 
 
 def chunk_text_smart(
@@ -78,6 +63,10 @@ def chunk_text_smart(
     Пытается разбивать текст по естественным границам (абзацы, предложения),
     а не просто по количеству символов.
     
+    Работает за линейное время: границы чанков хранятся как смещения
+    (start, end) в исходной строке, и каждый чанк вырезается срезом ровно
+    один раз - промежуточные строки не склеиваются.
+    
     Args:
         text: Исходный текст
         chunk_size: Целевой размер чанка
@@ -100,71 +89,91 @@ def chunk_text_smart(
             ' '      # Пробел (последний вариант)
         ]
     
+    # Проверяем входные параметры так же, как chunk_text
+    if chunk_size <= 0:
+        raise ValueError("chunk_size должен быть больше 0")
+    
+    if overlap < 0:
+        raise ValueError("overlap не может быть отрицательным")
+    
+    if overlap >= chunk_size:
+        raise ValueError("overlap должен быть меньше chunk_size")
+    
     # Если текст короткий, возвращаем его целиком
     if len(text) <= chunk_size:
         return [text]
     
+    separators = tuple(separators)
+    n = len(text)
     chunks = []
+    start = 0
+    # Разрез не раньше середины окна, чтобы разделитель в самом начале
+    # окна не давал слишком коротких чанков, и не раньше overlap + 1,
+    # иначе следующее окно (начинающееся на end - overlap) не продвинется
+    min_offset = max(chunk_size // 2, overlap + 1)
     
-    # Рекурсивная функция для разбиения текста
-    def split_text(text: str, separators: List[str]) -> List[str]:
-        """Рекурсивно разбивает текст по разделителям"""
-        if not text:
-            return []
-        
-        if len(text) <= chunk_size:
-            return [text]
+    # Скользящее окно: в пределах [start, start + chunk_size] ищем самый
+    # приоритетный разделитель, режем по нему и сдвигаемся с перекрытием.
+    # Исходная строка только нарезается, без split и склеивания частей
+    while start < n:
+        end = start + chunk_size
+        if end >= n:
+            end = n
+        else:
+            end = _best_split(text, start + min_offset, end, separators)
         
-        # Пробуем разделители по порядку
-        for separator in separators:
-            if separator in text:
-                # Разбиваем текст по текущему разделителю
-                parts = text.split(separator)
-                
-                result = []
-                current_chunk = ""
-                
-                for part in parts:
-                    # Добавляем разделитель обратно (кроме последней части)
-                    part_with_sep = part + separator if part != parts[-1] else part
-                    
-                    # Если добавление части не превышает размер чанка
-                    if len(current_chunk) + len(part_with_sep) <= chunk_size:
-                        current_chunk += part_with_sep
-                    else:
-                        # Сохраняем текущий чанк, если он не пустой
-                        if current_chunk:
-                            result.append(current_chunk.strip())
-                        
-                        # Если сама часть слишком большая, разбиваем рекурсивно
-                        if len(part_with_sep) > chunk_size:
-                            # Используем следующие разделители
-                            next_separators = separators[separators.index(separator) + 1:]
-                            if next_separators:
-                                result.extend(split_text(part_with_sep, next_separators))
-                            else:
-                                # Если больше нет разделителей, используем простое разбиение
-                                result.extend(chunk_text(part_with_sep, chunk_size, overlap))
-                            current_chunk = ""
-                        else:
-                            current_chunk = part_with_sep
-                
-                # Добавляем последний чанк
-                if current_chunk:
-                    result.append(current_chunk.strip())
-                
-                return result
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
         
-        # Если не нашли подходящих разделителей, используем простое разбиение
-        return chunk_text(text, chunk_size, overlap)
+        if end >= n:
+            break
+        # Окно всегда сдвигается вперед хотя бы на символ, даже если
+        # разрез пришелся ближе overlap к началу окна. Начало переносится
+        # вперед на ближайшую границу слова, чтобы чанк не начинался
+        # с обрывка слова
+        start = _next_boundary(text, max(end - overlap, start + 1), end, separators)
     
-    # Выполняем разбиение
-    chunks = split_text(text, separators)
+    return chunks
+
+
+def _best_split(text: str, lo: int, hi: int, separators: tuple) -> int:
+    """
+    Находит позицию разреза в text[lo:hi].
     
-    # Фильтруем пустые чанки
-    chunks = [chunk for chunk in chunks if chunk.strip()]
+    Разделители проверяются по приоритету, для каждого берется самое правое
+    вхождение через rfind - первое найденное и возвращается, без
+    проверок `in` и split. Если ни один не найден, режем ровно по hi.
     
-    return chunks
+    Returns:
+        Индекс конца чанка (разделитель остается в конце чанка)
+    """
+    # rfind просматривает только текущее окно и обычно останавливается на
+    # первом же разделителе. Предварительный сбор всех границ текста через
+    # re.finditer + bisect в разы медленнее: границ почти столько же,
+    # сколько слов, а нужна из них лишь одна на окно
+    for separator in separators:
+        position = text.rfind(separator, lo, hi)
+        if position != -1:
+            return position + len(separator)
+    return hi
+
+
+def _next_boundary(text: str, lo: int, hi: int, separators: tuple) -> int:
+    """
+    Находит начало следующего чанка в text[lo:hi].
+    
+    Returns:
+        Ближайшая к lo позиция сразу после разделителя (lo, если разделитель
+        заканчивается ровно на lo) или lo, если в окне нет разделителей
+    """
+    best = hi + 1
+    for separator in separators:
+        # Разделитель может начинаться до lo и заканчиваться на lo
+        position = text.find(separator, max(lo - len(separator), 0), min(best, hi))
+        if position != -1:
+            best = min(best, position + len(separator))
+    return best if best <= hi else lo
 
 
 def create_chunks_with_metadata(
@@ -3,8 +3,33 @@
 Парсит HTML с помощью BeautifulSoup и извлекает чистый текст.
 """
 
+import html
+import os
 import re
-from bs4 import BeautifulSoup
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from ._regex import LINE_BREAKS_RE, SPACES_RE
+
+
+# Из документа строятся только <title> и <body>: остальное содержимое <head>
+# (meta, link, style, script) отбрасывается еще на этапе разбора
+_CONTENT_STRAINER = SoupStrainer(['title', 'body'])
+
+# Быстрый путь для extract_metadata_from_html: title и meta description
+# в обычной разметке находятся регулярными выражениями без разбора документа
+_TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title\s*>', re.I | re.S)
+_DESC_RE = re.compile(
+    r'<meta\s[^>]*?name\s*=\s*["\']description["\'][^>]*?'
+    r'content\s*=\s*(?:"([^"]*)"|\'([^\']*)\')',
+    re.I
+)
+
+
+def _read_html(file_path: str) -> str:
+    """Читает исходный HTML-файл."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
 
 
 def load_html(file_path: str) -> str:
@@ -19,13 +44,16 @@ def load_html(file_path: str) -> str:
     """
     try:
         # Читаем HTML-файл
-        with open(file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
+        html_content = _read_html(file_path)
         
-        # Парсим HTML с помощью BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Парсим HTML быстрым C-парсером lxml, сохраняя только title и body
+        soup = BeautifulSoup(html_content, 'lxml', parse_only=_CONTENT_STRAINER)
+        if not soup.contents:
+            # Документ без <body> разбираем целиком
+            soup = BeautifulSoup(html_content, 'lxml')
         
-        # Удаляем script и style теги (они не содержат полезного текста)
+        # Удаляем script и style теги (они не содержат полезного текста).
+        # Вложенные теги SoupStrainer не отфильтровывает, поэтому они удаляются здесь
         for script in soup(["script", "style"]):
             script.decompose()
         
@@ -54,20 +82,11 @@ def clean_html_text(text: str) -> str:
     Returns:
         Очищенный текст
     """
-    # Разбиваем на строки и удаляем пробелы с краев каждой строки
-    lines = [line.strip() for line in text.split('\n')]
-    
-    # Удаляем пустые строки
-    lines = [line for line in lines if line]
-    
-    # Соединяем строки обратно
-    text = '\n'.join(lines)
-    
     # Удаляем множественные пробелы
-    text = re.sub(r' +', ' ', text)
+    text = SPACES_RE.sub(' ', text)
     
-    # Удаляем множественные переносы строк (оставляем максимум два подряд)
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    # Удаляем пробелы с краев каждой строки и пустые строки
+    text = LINE_BREAKS_RE.sub('\n', text)
     
     # Убираем пробелы в начале и конце
     text = text.strip()
@@ -87,9 +106,13 @@ def extract_metadata_from_html(file_path: str) -> dict:
         Словарь с метаданными
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
+        html_content = _read_html(file_path)
+        
+        metadata = _extract_metadata_fast(html_content)
+        if metadata is not None:
+            return metadata
         
+        # Нестандартная разметка: разбираем документ целиком
         soup = BeautifulSoup(html_content, 'html.parser')
         
         metadata = {}
@@ -110,6 +133,39 @@ def extract_metadata_from_html(file_path: str) -> dict:
         return {}
 
 
+def _extract_metadata_fast(html_content: str):
+    """
+    Извлекает title и meta description регулярными выражениями.
+    
+    Args:
+        html_content: Исходный HTML
+        
+    Returns:
+        Словарь с метаданными или None, если разметку нельзя надежно
+        разобрать без парсера
+    """
+    metadata = {}
+    
+    if '<title' in html_content or '<TITLE' in html_content:
+        match = _TITLE_RE.search(html_content)
+        if match is None or '<' in match.group(1):
+            return None
+        # Как и у soup.title.string, пустой title дает None
+        metadata['title'] = html.unescape(match.group(1)) or None
+    
+    match = _DESC_RE.search(html_content)
+    if match is not None:
+        content = match.group(1) if match.group(1) is not None else match.group(2)
+        if content:
+            metadata['description'] = html.unescape(content)
+    elif re.search(r'name\s*=\s*["\']?description', html_content, re.I):
+        # Описание есть, но атрибуты записаны иначе (например, content
+        # перед name) - это разберет BeautifulSoup
+        return None
+    
+    return metadata
+
+
 if __name__ == "__main__":
     # Пример использования
     text = load_html("../data/sample.html")
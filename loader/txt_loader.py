@@ -3,7 +3,10 @@
 Читает содержимое TXT-файла и выполняет базовую очистку текста.
 """
 
-import re
+import mmap
+import os
+
+from ._regex import LINE_BREAKS_RE, SPACES_RE
 
 
 def load_txt(file_path: str) -> str:
@@ -17,9 +20,7 @@ def load_txt(file_path: str) -> str:
         Очищенный текст из файла
     """
     try:
-        # Читаем файл с явным указанием кодировки
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = _read_utf8(file_path)
         
         # Выполняем очистку текста
         cleaned_content = clean_text(content)
@@ -32,6 +33,32 @@ def load_txt(file_path: str) -> str:
         raise Exception(f"Ошибка при чтении файла: {str(e)}")
 
 
+def _read_utf8(file_path: str) -> str:
+    """
+    Читает файл в кодировке UTF-8 через mmap.
+    
+    Строка декодируется прямо из отображенных в память страниц, без
+    промежуточной копии всего файла в bytes. Переводы строк приводятся
+    к '\n', как при чтении в текстовом режиме.
+    
+    Args:
+        file_path: Путь к файлу
+        
+    Returns:
+        Содержимое файла
+    """
+    with open(file_path, 'rb') as f:
+        # Пустой файл нельзя отобразить в память
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            content = str(mm, 'utf-8')
+    
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+
 def clean_text(text: str) -> str:
     """
     Очищает текст от лишних пробелов и пустых строк.
@@ -42,25 +69,14 @@ def clean_text(text: str) -> str:
     Returns:
         Очищенный текст
     """
-    # Удаляем множественные пробелы и заменяем их на один
-    text = re.sub(r' +', ' ', text)
-    
-    # Удаляем множественные переносы строк (более 2 подряд)
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    # Заменяем множественные пробелы на один
+    text = SPACES_RE.sub(' ', text)
     
-    # Удаляем пробелы в начале и конце строк
-    lines = [line.strip() for line in text.split('\n')]
-    
-    # Удаляем полностью пустые строки (опционально, можно оставить для структуры)
-    lines = [line for line in lines if line]
-    
-    # Соединяем строки обратно
-    cleaned = '\n'.join(lines)
+    # Удаляем пробелы в начале и конце строк вместе с пустыми строками
+    text = LINE_BREAKS_RE.sub('\n', text)
     
     # Удаляем пробелы в начале и конце всего текста
-    cleaned = cleaned.strip()
-    
-    return cleaned
+    return text.strip()
 
 
 if __name__ == "__main__":
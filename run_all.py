@@ -10,8 +10,11 @@
     python run_all.py
 """
 
+import argparse
 import os
+import platform
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -20,9 +23,47 @@ load_dotenv()
 from loader.txt_loader import load_txt
 from loader.html_loader import load_html
 from loader.chunker import create_chunks_with_metadata
+from embeddings import SemanticQueryCache, cached_search
 from faiss_store.faiss_client import FAISSClient
 
 
+# Эмбеддинги при загрузке запрашиваются батчами по EMBED_BATCH_SIZE текстов,
+# до EMBED_CONCURRENCY запросов к OpenAI одновременно
+EMBED_BATCH_SIZE = 256
+EMBED_CONCURRENCY = 8
+
+# Чанки отправляются в индекс пачками, чтобы не держать в памяти тексты
+# и эмбеддинги всего корпуса. Пачка занимает все EMBED_CONCURRENCY
+# запросов к OpenAI, иначе часть конкурентности простаивает
+INGEST_FLUSH_CHUNKS = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+
+# Разделители вывода строятся один раз
+BANNER = "=" * 70
+SEPARATOR = "-" * 70
+
+# Команды интерактивного режима
+_EXIT = frozenset({'exit', 'quit', 'q'})
+_HELP = 'help'
+
+# Сколько символов текста чанка показывать в результатах
+_MAX_DOC = 400
+
+# Значки в блоке результатов выводятся только в терминал: при выводе
+# в файл или в другую программу они лишние
+_RESULT_ICONS = {'search': "🔍 ", 'doc': "📄 ", 'text': "📝 ", 'none': "❌ "}
+_PLAIN_ICONS = dict.fromkeys(_RESULT_ICONS, "")
+
+# Загрузчик и тип документа для каждого поддерживаемого расширения
+_LOADERS = {
+    '.txt': (load_txt, 'txt'),
+    '.html': (load_html, 'html'),
+    '.htm': (load_html, 'html'),
+}
+
+# Расширения файлов, которые загружаются из data/
+SUPPORTED_EXTENSIONS = frozenset(_LOADERS)
+
+
 def check_openai_key():
     """Проверяет наличие OpenAI API ключа."""
     api_key = os.getenv("OPENAI_API_KEY")
@@ -44,31 +85,54 @@ def check_openai_key():
 
 def load_document(file_path: str):
     """Загружает документ в зависимости от его типа."""
-    file_ext = Path(file_path).suffix.lower()
+    file_ext = os.path.splitext(file_path)[1].lower()
     
-    if file_ext == '.txt':
-        return load_txt(file_path), 'txt'
-    elif file_ext in ['.html', '.htm']:
-        return load_html(file_path), 'html'
-    else:
+    try:
+        loader, doc_type = _LOADERS[file_ext]
+    except KeyError:
         raise ValueError(f"Неподдерживаемый формат: {file_ext}")
+    return loader(file_path), doc_type
+
+
+def _process_one(file_path: str):
+    """
+    Загружает и разбивает на чанки один файл (выполняется в дочернем процессе).
+    
+    Returns:
+        Кортеж (длина текста, чанки с метаданными) или строка с ошибкой
+    """
+    try:
+        text, doc_type = load_document(file_path)
+        chunks_with_meta = create_chunks_with_metadata(
+            text=text,
+            chunk_size=500,
+            overlap=100,
+            source=os.path.basename(file_path),
+            doc_type=doc_type
+        )
+        return len(text), chunks_with_meta
+    except Exception as e:
+        return str(e)
 
 
 def ingest_documents():
     """Загружает документы в FAISS."""
-    print("\n" + "=" * 70)
+    print("\n" + BANNER)
     print("ШАГ 1: ЗАГРУЗКА ДОКУМЕНТОВ В FAISS")
-    print("=" * 70)
+    print(BANNER)
     
-    data_dir = Path("data")
-    if not data_dir.exists():
+    data_dir = "data"
+    if not os.path.isdir(data_dir):
         print(f"❌ Директория {data_dir} не найдена!")
         return None
     
-    file_paths = [
-        str(f) for f in data_dir.iterdir() 
-        if f.suffix.lower() in ['.txt', '.html', '.htm']
-    ]
+    # DirEntry кэширует имя и тип файла, лишних stat() не делается
+    with os.scandir(data_dir) as entries:
+        file_paths = [
+            entry.path for entry in entries
+            if entry.is_file(follow_symlinks=False)
+            and os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS
+        ]
     
     if not file_paths:
         print("❌ Не найдено файлов для обработки!")
@@ -77,58 +141,84 @@ def ingest_documents():
     print(f"Найдено файлов: {len(file_paths)}")
     print()
     
+    print("📦 Инициализация FAISS...")
+    client = FAISSClient(
+        persist_directory="./faiss_db",
+        index_name="documents",
+        embed_concurrency=EMBED_CONCURRENCY,
+        embed_batch_size=EMBED_BATCH_SIZE
+    )
+    print()
+    
     all_chunks = []
     all_metadatas = []
     all_ids = []
     doc_counter = 0
+    total_chunks = 0
     
-    for file_path in file_paths:
-        try:
-            print(f"📄 Обработка: {Path(file_path).name}")
-            text, doc_type = load_document(file_path)
-            print(f"   Загружено: {len(text)} символов")
-            
-            chunks_with_meta = create_chunks_with_metadata(
-                text=text,
-                chunk_size=500,
-                overlap=100,
-                source=Path(file_path).name,
-                doc_type=doc_type
-            )
-            print(f"   Чанков: {len(chunks_with_meta)}")
-            
-            for chunk_data in chunks_with_meta:
-                all_chunks.append(chunk_data['text'])
-                all_metadatas.append(chunk_data['metadata'])
-                chunk_id = f"doc_{doc_counter}_chunk_{chunk_data['metadata']['chunk_id']}"
-                all_ids.append(chunk_id)
-            
-            doc_counter += 1
-            print(f"   ✅ Готово!\n")
-            
-        except Exception as e:
-            print(f"   ❌ Ошибка: {str(e)}\n")
-            continue
-    
-    if not all_chunks:
-        print("❌ Не удалось обработать ни одного документа!")
-        return None
-    
-    print(f"Всего чанков: {len(all_chunks)}")
-    
-    print("\n📦 Инициализация FAISS...")
-    client = FAISSClient(
-        persist_directory="./faiss_db",
-        index_name="documents"
-    )
-    
-    print("💾 Создание эмбеддингов и сохранение...")
-    try:
+    def _maybe_flush(force: bool = False):
+        """Отправляет накопленные чанки в FAISS, когда их набралось на пачку."""
+        nonlocal total_chunks
+        if not all_chunks or (not force and len(all_chunks) < INGEST_FLUSH_CHUNKS):
+            return
+        print(f"💾 Создание эмбеддингов и сохранение: {len(all_chunks)} чанков...")
+        embeddings = client.embed_texts(all_chunks)
         client.add_documents(
             texts=all_chunks,
             metadatas=all_metadatas,
-            ids=all_ids
+            ids=all_ids,
+            save=False,
+            embeddings=embeddings
         )
+        total_chunks += len(all_chunks)
+        all_chunks.clear()
+        all_metadatas.clear()
+        all_ids.clear()
+        print()
+    
+    try:
+        # Файлы независимы, поэтому загружаются и чанкуются в нескольких
+        # процессах. map возвращает результаты в порядке файлов, а ID чанков
+        # назначаются здесь, в основном процессе, - они детерминированы
+        file_paths.sort()
+        workers = min(os.cpu_count() or 1, len(file_paths))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for file_path, result in zip(
+                file_paths, pool.map(_process_one, file_paths, chunksize=4)
+            ):
+                print(f"📄 Обработка: {os.path.basename(file_path)}")
+                if isinstance(result, str):
+                    print(f"   ❌ Ошибка: {result}\n")
+                    continue
+                
+                text_length, chunks_with_meta = result
+                print(f"   Загружено: {text_length} символов")
+                print(f"   Чанков: {len(chunks_with_meta)}")
+                
+                # Списки пополняются целиком через extend, а не по одному append
+                # на каждый чанк
+                all_chunks.extend([c['text'] for c in chunks_with_meta])
+                all_metadatas.extend([c['metadata'] for c in chunks_with_meta])
+                all_ids.extend([
+                    f"doc_{doc_counter}_chunk_{c['metadata']['chunk_id']}"
+                    for c in chunks_with_meta
+                ])
+                
+                doc_counter += 1
+                print(f"   ✅ Готово!\n")
+                
+                # Чанки уходят в индекс пачками, а не копятся до конца:
+                # в памяти одновременно не больше одной пачки текстов и эмбеддингов
+                _maybe_flush()
+        
+        _maybe_flush(force=True)
+        
+        if not total_chunks:
+            print("❌ Не удалось обработать ни одного документа!")
+            return None
+        
+        print(f"Всего чанков: {total_chunks}")
+        client.save_index()
         print("✅ Документы успешно загружены в FAISS!")
         return client
     except Exception as e:
@@ -136,44 +226,82 @@ def ingest_documents():
         return None
 
 
+def _write(lines):
+    """Выводит строки одной записью в stdout вместо print на каждую строку."""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
+def _shorten(text: str, width: int) -> str:
+    """
+    Обрезает текст до width символов по границе слова.
+    
+    В отличие от textwrap.shorten, переводы строк внутри текста сохраняются.
+    """
+    if len(text) <= width:
+        return text
+    # Берем на символ больше: если он пробельный, последнее слово целое
+    parts = text[:width + 1].rsplit(None, 1)
+    head = parts[0] if len(parts) == 2 and parts[0] else text[:width]
+    return head.rstrip() + "..."
+
+
 def display_results(results: dict, query: str):
     """Отображает результаты поиска."""
-    print("\n" + "=" * 70)
-    print(f"🔍 РЕЗУЛЬТАТЫ: {query}")
-    print("=" * 70)
+    icons = _RESULT_ICONS if sys.stdout.isatty() else _PLAIN_ICONS
+    lines = ["\n" + BANNER, f"{icons['search']}РЕЗУЛЬТАТЫ: {query}", BANNER]
     
-    if not results['documents'] or not results['documents'][0]:
-        print("❌ Ничего не найдено")
+    # Пустой ответ приходит либо без списка на запрос, либо с пустым списком
+    docs = results['documents'][0] if results['documents'] else []
+    if not docs:
+        lines.append(f"{icons['none']}Ничего не найдено")
+        _write(lines)
         return
     
-    for i, (doc, metadata, distance) in enumerate(zip(
-        results['documents'][0],
-        results['metadatas'][0],
-        results['distances'][0]
-    )):
-        print(f"\n📄 Результат {i + 1}")
-        print("-" * 70)
-        print(f"Источник: {metadata.get('source', 'N/A')}")
-        print(f"Тип: {metadata.get('type', 'N/A').upper()}")
-        print(f"Distance: {distance:.4f}")
-        print(f"\n📝 Текст:")
-        display_text = doc if len(doc) <= 400 else doc[:400] + "..."
-        print(display_text)
-        print("-" * 70)
+    metadatas = results['metadatas'][0]
+    distances = results['distances'][0]
+    # Значки одинаковы для всех результатов - берем их из словаря один раз
+    doc_icon, text_icon = icons['doc'], icons['text']
+    for i in range(len(docs)):
+        get = metadatas[i].get
+        lines += [
+            f"\n{doc_icon}Результат {i + 1}",
+            SEPARATOR,
+            f"Источник: {get('source', 'N/A')}",
+            f"Тип: {get('type', 'N/A').upper()}",
+            f"Distance: {distances[i]:.4f}",
+            f"\n{text_icon}Текст:",
+            _shorten(docs[i], _MAX_DOC),
+            SEPARATOR,
+        ]
+    _write(lines)
 
 
 def interactive_search(client: FAISSClient):
     """Интерактивный режим поиска."""
-    print("\n" + "=" * 70)
-    print("ШАГ 2: ИНТЕРАКТИВНЫЙ ПОИСК")
-    print("=" * 70)
-    print("Введите 'exit' или 'quit' для выхода")
-    print("Введите 'help' для справки")
-    print("=" * 70)
+    _write([
+        "\n" + BANNER,
+        "ШАГ 2: ИНТЕРАКТИВНЫЙ ПОИСК",
+        BANNER,
+        "Введите 'exit' или 'quit' для выхода",
+        "Введите 'help' для справки",
+        BANNER,
+    ])
     
     stats = client.get_index_stats()
     print(f"\n📊 В базе данных: {stats['document_count']} документов")
     
+    # Перефразированные повторы запросов обслуживаются из кэша;
+    # кэш сохраняется в файл при выходе из интерпретатора
+    query_cache = SemanticQueryCache(
+        path="./faiss_db/documents.qcache.npz",
+        version=client.index_version()
+    )
+    _search_loop(client, query_cache)
+
+
+def _search_loop(client: FAISSClient, query_cache: SemanticQueryCache):
+    """Цикл чтения запросов интерактивного поиска."""
     while True:
         try:
             query = input("\n🔍 Введите запрос: ").strip()
@@ -181,22 +309,30 @@ def interactive_search(client: FAISSClient):
             if not query:
                 continue
             
-            if query.lower() in ['exit', 'quit', 'q']:
+            command = query.lower()
+            if command in _EXIT:
                 print("\n👋 До свидания!")
                 break
             
-            if query.lower() == 'help':
-                print("\n📖 Справка:")
-                print("  - Просто введите вопрос на естественном языке")
-                print("  - Примеры:")
-                print("    • Что такое корпоративная культура?")
-                print("    • Какие инструменты использует команда?")
-                print("    • Расскажи про удаленную работу")
-                print("  - 'exit' или 'quit' - выход")
+            if command == _HELP:
+                info = client.query_cache_info()
+                _write([
+                    "\n📖 Справка:",
+                    "  - Просто введите вопрос на естественном языке",
+                    "  - Примеры:",
+                    "    • Что такое корпоративная культура?",
+                    "    • Какие инструменты использует команда?",
+                    "    • Расскажи про удаленную работу",
+                    "  - 'exit' или 'quit' - выход",
+                    f"\n🗄️ Кэш эмбеддингов запросов: {info.hits} попаданий, "
+                    f"{info.misses} промахов",
+                    f"🗄️ Кэш результатов: {query_cache.hits} попаданий, "
+                    f"{query_cache.misses} промахов",
+                ])
                 continue
             
             try:
-                results = client.search(query=query, n_results=3)
+                results = cached_search(client, query_cache, query=query, n_results=3)
                 display_results(results, query)
             except Exception as e:
                 print(f"\n❌ Ошибка при поиске: {str(e)}")
@@ -210,21 +346,30 @@ def interactive_search(client: FAISSClient):
             continue
 
 
+# Парсер аргументов строится один раз, при первом обращении
+_PARSER = None
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    """Возвращает парсер аргументов командной строки (создается один раз)."""
+    global _PARSER
+    if _PARSER is None:
+        _PARSER = argparse.ArgumentParser(description="Запуск полного пайплайна RAG")
+        _PARSER.add_argument(
+            '--openai-key',
+            type=str,
+            help='API ключ OpenAI'
+        )
+    return _PARSER
+
+
 def main():
     """Основная функция - запускает весь пайплайн."""
-    print("=" * 70)
+    print(BANNER)
     print("🚀 RAG FAISS DEMO - ПОЛНЫЙ ПАЙПЛАЙН")
-    print("=" * 70)
-    
-    import argparse
-    parser = argparse.ArgumentParser(description="Запуск полного пайплайна RAG")
-    parser.add_argument(
-        '--openai-key',
-        type=str,
-        help='API ключ OpenAI'
-    )
+    print(BANNER)
     
-    args = parser.parse_args()
+    args = _get_parser().parse_args()
     
     if args.openai_key:
         os.environ['OPENAI_API_KEY'] = args.openai_key
@@ -246,7 +391,10 @@ def main():
                 persist_directory="./faiss_db",
                 index_name="documents"
             )
-            if not client.load_index():
+            # Индекс отображается в память: страницы подгружает ОС, старт
+            # не ждет чтения всего файла. На Windows mmap в faiss ненадежен
+            use_mmap = platform.system() != 'Windows'
+            if not client.load_index(mmap=use_mmap):
                 print("❌ Не удалось загрузить индекс!")
                 sys.exit(1)
     else:
@@ -258,9 +406,9 @@ def main():
     
     interactive_search(client)
     
-    print("\n" + "=" * 70)
+    print("\n" + BANNER)
     print("🎉 СПАСИБО ЗА ИСПОЛЬЗОВАНИЕ RAG FAISS DEMO!")
-    print("=" * 70)
+    print(BANNER)
 
 
 if __name__ == "__main__":
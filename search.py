@@ -9,158 +9,811 @@
     
     # Интерактивный режим:
     python search.py --interactive
+    
+    # Пакетный поиск (по запросу на строку файла):
+    python search.py --batch-file queries.txt
+    
+    # Фоновый процесс с загруженным индексом; последующие вызовы
+    # search.py "запрос" обращаются к нему и не загружают индекс сами:
+    python search.py --serve
 """
 
+import functools
+import json
+import os
+import socket
+import socketserver
 import sys
 import argparse
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Optional, Tuple
+
+# Настройки OpenMP читаются при загрузке faiss, поэтому задаются до его
+# импорта: между запросами потоки засыпают, а не крутятся в ожидании
+os.environ.setdefault("OMP_WAIT_POLICY", "PASSIVE")
+os.environ.setdefault("KMP_BLOCKTIME", "0")
+
+# faiss, numpy и openai импортируются внутри функций, которым они нужны:
+# --help, ошибки в аргументах и поиск через фоновый процесс не тратят
+# время на их загрузку
+if TYPE_CHECKING:
+    from embeddings import SemanticQueryCache
+    from faiss_store.faiss_client import FAISSClient
+
+
+# Разделители вывода строятся один раз
+BANNER = "=" * 80
+SEPARATOR = "-" * 80
+
+# Команды интерактивного режима
+_EXIT = frozenset({'exit', 'quit', 'q'})
+_HELP = 'help'
+_MORE = 'more'
+
+# Число потоков FAISS: для одного короткого запроса много потоков
+# не нужно, а на многоядерной машине они мешают другим процессам
+SEARCH_THREADS = int(os.environ.get("FAISS_THREADS", min(8, os.cpu_count() or 1)))
+
+# История запросов интерактивного режима (при установленном prompt_toolkit)
+HISTORY_PATH = os.path.expanduser("~/.rag_search_history")
+
+# Сколько результатов интерактивный режим показывает за раз
+INTERACTIVE_PAGE_SIZE = 3
+
+# Сколько символов текста чанка показывать в результатах
+_MAX_DOC = 500
+
+# Значки в блоке результатов выводятся только в терминал: при выводе
+# в файл или в другую программу они лишние
+_RESULT_ICONS = {'search': "🔍 ", 'doc': "📄 ", 'text': "📝 ", 'none': "❌ "}
+_PLAIN_ICONS = dict.fromkeys(_RESULT_ICONS, "")
+
+# Сколько секунд ждать подключения к фоновому процессу поиска
+SERVE_CONNECT_TIMEOUT = 0.5
+
+# Сколько запросов из файла обрабатывается за раз: 2048 - предел числа
+# текстов в одном запросе к OpenAI embeddings; заодно матрица запросов
+# и результаты большого файла не держатся в памяти целиком
+BATCH_QUERY_CHUNK = 2048
 
-from faiss_store.faiss_client import FAISSClient
+# Описание узлов NUMA в Linux
+_NUMA_NODES_DIR = "/sys/devices/system/node"
 
 
-def display_results(results: dict, query: str):
-    """Отображает результаты поиска в удобном формате."""
-    print("\n" + "=" * 80)
-    print(f"РЕЗУЛЬТАТЫ ПОИСКА")
-    print("=" * 80)
-    print(f"Запрос: {query}")
-    print("=" * 80)
+def open_query_cache(client: "FAISSClient", index_name: str) -> "SemanticQueryCache":
+    """Открывает семантический кэш результатов поиска для индекса."""
+    from embeddings import SemanticQueryCache
     
-    if not results['documents'] or not results['documents'][0]:
-        print("\n❌ Ничего не найдено")
+    return SemanticQueryCache(
+        path=f"./faiss_db/{index_name}.qcache.npz",
+        version=client.index_version()
+    )
+
+
+def _write(lines):
+    """Выводит строки одной записью в stdout вместо print на каждую строку."""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
+def _shorten(text: str, width: int) -> str:
+    """
+    Обрезает текст до width символов по границе слова.
+    
+    В отличие от textwrap.shorten, переводы строк внутри текста сохраняются.
+    """
+    if len(text) <= width:
+        return text
+    # Берем на символ больше: если он пробельный, последнее слово целое
+    parts = text[:width + 1].rsplit(None, 1)
+    head = parts[0] if len(parts) == 2 and parts[0] else text[:width]
+    return head.rstrip() + "..."
+
+
+def display_results(results: dict, query: str, start: int = 0):
+    """
+    Отображает результаты поиска в удобном формате.
+    
+    Args:
+        results: Результаты поиска
+        query: Поисковый запрос
+        start: С какого результата начинать (для следующей страницы)
+    """
+    icons = _RESULT_ICONS if sys.stdout.isatty() else _PLAIN_ICONS
+    lines = ["\n" + BANNER, "РЕЗУЛЬТАТЫ ПОИСКА", BANNER, f"Запрос: {query}", BANNER]
+    
+    # Пустой ответ приходит либо без списка на запрос, либо с пустым списком
+    docs = results['documents'][0] if results['documents'] else []
+    if not docs:
+        lines.append(f"\n{icons['none']}Ничего не найдено")
+        _write(lines)
         return
     
-    for i, (doc, metadata, distance) in enumerate(zip(
-        results['documents'][0],
-        results['metadatas'][0],
-        results['distances'][0]
-    )):
-        print(f"\n📄 Результат {i + 1}")
-        print("-" * 80)
-        
-        print(f"Источник: {metadata.get('source', 'N/A')}")
-        print(f"Тип: {metadata.get('type', 'N/A').upper()}")
-        print(f"Чанк: {metadata.get('chunk_id', 'N/A')} из {metadata.get('total_chunks', 'N/A')}")
-        print(f"Distance: {distance:.4f}")
-        
-        print(f"\n📝 Текст:")
-        print("-" * 80)
-        display_text = doc if len(doc) <= 500 else doc[:500] + "..."
-        print(display_text)
-        print("-" * 80)
+    # Результаты уже разложены по столбцам - обходим их по индексу,
+    # не собирая кортеж на каждую строку
+    metadatas = results['metadatas'][0]
+    distances = results['distances'][0]
+    # Значки одинаковы для всех результатов - берем их из словаря один раз
+    doc_icon, text_icon = icons['doc'], icons['text']
+    for i in range(start, len(docs)):
+        get = metadatas[i].get
+        lines += [
+            f"\n{doc_icon}Результат {i + 1}",
+            SEPARATOR,
+            f"Источник: {get('source', 'N/A')}",
+            f"Тип: {get('type', 'N/A').upper()}",
+            f"Чанк: {get('chunk_id', 'N/A')} из {get('total_chunks', 'N/A')}",
+            f"Distance: {distances[i]:.4f}",
+            f"\n{text_icon}Текст:",
+            SEPARATOR,
+            _shorten(docs[i], _MAX_DOC),
+            SEPARATOR,
+        ]
     
-    print()
+    lines.append("")
+    _write(lines)
 
 
-def search_documents(
+@functools.lru_cache(maxsize=4)
+def _get_client(persist_directory: str, index_name: str) -> "FAISSClient":
+    """
+    Создает клиент FAISS (один раз на процесс).
+    
+    Индекс загружает client.open(): если индекса еще нет, следующий
+    вызов попробует загрузить его снова.
+    """
+    from faiss_store.faiss_client import FAISSClient
+    
+    return FAISSClient(
+        persist_directory=persist_directory,
+        index_name=index_name,
+        num_threads=SEARCH_THREADS
+    )
+
+
+def _build_client(
+    index_name: str = "documents",
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    gpu: bool = False
+) -> Tuple[Optional["FAISSClient"], dict]:
+    """
+    Возвращает клиент FAISS с загруженным индексом и статистику индекса.
+    
+    Args:
+        index_name: Имя индекса
+        ef_search: Размер очереди кандидатов HNSW (None - по умолчанию)
+        nprobe: Количество просматриваемых кластеров IVF (None - по умолчанию)
+        gpu: Искать на GPU при любом размере индекса (если GPU есть)
+    
+    Returns:
+        (клиент, статистика) или (None, {}), если индекс не найден
+    """
+    client = _get_client("./faiss_db", index_name)
+    loaded, stats = client.open()
+    if not loaded:
+        return None, {}
+    client.set_search_params(ef_search=ef_search, nprobe=nprobe)
+    # Клиент общий для процесса, поэтому порог задается при каждом вызове.
+    # Без faiss-gpu и CUDA клиент остается на CPU
+    from faiss_store.faiss_client import GPU_MIN_VECTORS
+    client.gpu_min_vectors = 0 if gpu else GPU_MIN_VECTORS
+    return client, stats
+
+
+def _execute_search(
+    client: "FAISSClient",
+    query_cache: "SemanticQueryCache",
     query: str,
     n_results: int = 5,
-    openai_api_key: Optional[str] = None,
-    index_name: str = "documents",
-    filter_type: Optional[str] = None
+    where: Optional[dict] = None,
+    openai_api_key: Optional[str] = None
 ):
-    """Выполняет поиск по документам."""
-    client = FAISSClient(
-        persist_directory="./faiss_db",
-        index_name=index_name
-    )
+    """Выполняет поиск уже загруженным клиентом и выводит результаты."""
+    from embeddings import cached_search
     
-    # Загружаем индекс
-    if not client.load_index():
+    results = cached_search(
+        client,
+        query_cache,
+        query=query,
+        n_results=n_results,
+        where=where,
+        openai_api_key=openai_api_key
+    )
+    display_results(results, query)
+
+
+def _load_client_or_exit(
+    index_name: str,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    gpu: bool = False
+) -> "FAISSClient":
+    """Загружает индекс; если его нет или он пуст, завершает скрипт."""
+    client, stats = _build_client(index_name, ef_search, nprobe, gpu)
+    if client is None:
         print("❌ Индекс не найден!")
         print("\n💡 Подсказка: Убедитесь, что вы запустили ingest.py перед поиском!")
         sys.exit(1)
     
-    stats = client.get_index_stats()
     if stats.get('document_count', 0) == 0:
         print("❌ В индексе нет документов!")
         print("\n💡 Подсказка: Сначала загрузите документы с помощью ingest.py")
         sys.exit(1)
     
     print(f"\n📊 В индексе '{index_name}': {stats['document_count']} документов")
+    return client
+
+
+def _socket_path(index_name: str) -> str:
+    """Путь к Unix-сокету фонового процесса поиска для индекса."""
+    return f"./faiss_db/{index_name}.search.sock"
+
+
+def _search_via_server(
+    index_name: str,
+    query: str,
+    n_results: int,
+    where: Optional[dict],
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    gpu: bool = False
+) -> Optional[dict]:
+    """
+    Выполняет поиск через фоновый процесс (search.py --serve).
     
+    Параметры поиска ef_search, nprobe и gpu передаются вместе с запросом
+    и действуют в фоновом процессе только на этот запрос.
+    
+    Returns:
+        Результаты поиска или None, если фоновый процесс не запущен
+    
+    Raises:
+        Exception: Если фоновый процесс вернул ошибку поиска
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(SERVE_CONNECT_TIMEOUT)
+        try:
+            sock.connect(_socket_path(index_name))
+        except OSError:
+            return None
+        # Сам поиск может ждать ответа OpenAI дольше таймаута подключения
+        sock.settimeout(None)
+        
+        request = {
+            'query': query,
+            'n_results': n_results,
+            'where': where,
+            'ef_search': ef_search,
+            'nprobe': nprobe,
+            'gpu': gpu
+        }
+        sock.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b"\n")
+        with sock.makefile('rb') as f:
+            response = json.loads(f.readline())
+    finally:
+        sock.close()
+    
+    if 'error' in response:
+        raise Exception(response['error'])
+    return response['results']
+
+
+def search_documents(
+    query: str,
+    n_results: int = 5,
+    openai_api_key: Optional[str] = None,
+    index_name: str = "documents",
+    filter_type: Optional[str] = None,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    gpu: bool = False
+):
+    """Выполняет поиск по документам."""
     where = None
     if filter_type:
         where = {"type": filter_type}
+    
+    # Если запущен search.py --serve, индекс уже загружен в нем
+    try:
+        results = _search_via_server(
+            index_name, query, n_results, where, ef_search, nprobe, gpu
+        )
+    except Exception as e:
+        print(f"❌ Ошибка при поиске: {str(e)}")
+        sys.exit(1)
+    if results is not None:
+        display_results(results, query)
+        return
+    
+    client = _load_client_or_exit(index_name, ef_search, nprobe, gpu)
+    
+    if filter_type:
         print(f"🔍 Фильтр: только документы типа '{filter_type}'")
     
     try:
         print(f"\n🔍 Выполняется поиск...")
         
-        results = client.search(
-            query=query,
+        query_cache = open_query_cache(client, index_name)
+        _execute_search(
+            client,
+            query_cache,
+            query,
             n_results=n_results,
             where=where,
             openai_api_key=openai_api_key
         )
+    
+    except Exception as e:
+        print(f"❌ Ошибка при поиске: {str(e)}")
+        sys.exit(1)
+
+
+def search_batch_file(
+    batch_file: str,
+    n_results: int = 5,
+    openai_api_key: Optional[str] = None,
+    index_name: str = "documents",
+    filter_type: Optional[str] = None,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    gpu: bool = False
+):
+    """
+    Выполняет поиск по всем запросам из файла (по одному на строку).
+    
+    Запросы обрабатываются порциями по BATCH_QUERY_CHUNK: эмбеддинги
+    порции создаются пакетом, а FAISS ищет по всей матрице запросов порции
+    одним вызовом.
+    """
+    try:
+        with open(batch_file, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    except OSError as e:
+        print(f"❌ Не удалось прочитать файл запросов: {str(e)}")
+        sys.exit(1)
+    
+    if not queries:
+        print("❌ В файле нет запросов!")
+        sys.exit(1)
+    
+    client = _load_client_or_exit(index_name, ef_search, nprobe, gpu)
+    
+    where = None
+    if filter_type:
+        where = {"type": filter_type}
+        print(f"🔍 Фильтр: только документы типа '{filter_type}'")
+    
+    from embeddings import cached_search_batch
+    
+    try:
+        print(f"\n🔍 Выполняется поиск по {len(queries)} запросам...")
         
-        display_results(results, query)
-        
+        query_cache = open_query_cache(client, index_name)
+        for start in range(0, len(queries), BATCH_QUERY_CHUNK):
+            chunk = queries[start:start + BATCH_QUERY_CHUNK]
+            all_results = cached_search_batch(
+                client,
+                query_cache,
+                chunk,
+                n_results=n_results,
+                where=where,
+                openai_api_key=openai_api_key
+            )
+            for query, results in zip(chunk, all_results):
+                display_results(results, query)
+    
     except Exception as e:
         print(f"❌ Ошибка при поиске: {str(e)}")
         sys.exit(1)
 
 
+class _SearchServer(socketserver.UnixStreamServer):
+    """
+    Фоновый процесс поиска: держит индекс и кэш запросов загруженными.
+    
+    Запросы обрабатываются по одному: FAISSClient и кэш запросов
+    не рассчитаны на одновременное использование из нескольких потоков.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        client: "FAISSClient",
+        index_name: str,
+        openai_api_key: Optional[str] = None
+    ):
+        self.client = client
+        self.index_name = index_name
+        self.openai_api_key = openai_api_key
+        self.version = client.index_version()
+        self.query_cache = open_query_cache(client, index_name)
+        super().__init__(path, _SearchHandler)
+    
+    def search(self, request: dict) -> dict:
+        """Выполняет поиск по запросу клиента."""
+        from embeddings import cached_search
+        
+        # Индекс мог быть перестроен ingest.py, пока процесс работал
+        version = self.client.index_version()
+        if version != self.version:
+            print("🔄 Индекс изменился, загружаем заново...")
+            self.client.load_index(force=True)
+            self.version = self.client.index_version()
+            self.query_cache.clear(self.version)
+        
+        # Параметры поиска из запроса действуют только на этот запрос,
+        # затем восстанавливаются параметры, с которыми запущен процесс.
+        # set_search_params сбрасывает копию индекса на GPU, поэтому
+        # вызывается, только если параметры действительно отличаются
+        client = self.client
+        ef_search, nprobe, gpu_min_vectors = (
+            client.ef_search, client.nprobe, client.gpu_min_vectors
+        )
+        params_changed = (
+            request.get('ef_search') not in (None, ef_search)
+            or request.get('nprobe') not in (None, nprobe)
+        )
+        if params_changed:
+            client.set_search_params(
+                ef_search=request.get('ef_search'),
+                nprobe=request.get('nprobe')
+            )
+        if request.get('gpu'):
+            client.gpu_min_vectors = 0
+        try:
+            return cached_search(
+                client,
+                self.query_cache,
+                query=request['query'],
+                n_results=int(request.get('n_results', 5)),
+                where=request.get('where'),
+                openai_api_key=self.openai_api_key
+            )
+        finally:
+            if params_changed:
+                client.set_search_params(ef_search=ef_search, nprobe=nprobe)
+            client.gpu_min_vectors = gpu_min_vectors
+
+
+class _SearchHandler(socketserver.StreamRequestHandler):
+    """Обрабатывает один запрос: JSON-строка запроса -> JSON-строка ответа."""
+    
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # Подключение без запроса (проверка, запущен ли процесс)
+            return
+        try:
+            request = json.loads(line)
+            response = {'results': self.server.search(request)}
+        except Exception as e:
+            response = {'error': str(e)}
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+
+
+def serve(
+    openai_api_key: Optional[str] = None,
+    index_name: str = "documents",
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    gpu: bool = False
+):
+    """
+    Запускает фоновый процесс поиска на Unix-сокете.
+    
+    Индекс загружается один раз, и вызовы search.py "запрос" не тратят
+    время на запуск. Процесс работает долго и обслуживает запросы
+    по очереди, поэтому FAISS получает все ядра (если не задан FAISS_THREADS).
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        print("❌ Unix-сокеты не поддерживаются в этой системе")
+        sys.exit(1)
+    
+    import faiss
+    
+    client = _load_client_or_exit(index_name, ef_search, nprobe, gpu)
+    faiss.omp_set_num_threads(int(os.environ.get("FAISS_THREADS", _available_cpus())))
+    
+    path = _socket_path(index_name)
+    if os.path.exists(path):
+        # Сокет мог остаться от процесса, который завершился аварийно
+        if _server_is_alive(path):
+            print(f"❌ Процесс поиска уже запущен: {path}")
+            sys.exit(1)
+        os.remove(path)
+    
+    server = _SearchServer(path, client, index_name, openai_api_key)
+    print(f"🚀 Процесс поиска запущен: {path}")
+    print("   Для остановки нажмите Ctrl+C")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n\n👋 Процесс поиска остановлен")
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _server_is_alive(path: str) -> bool:
+    """Проверяет, принимает ли подключения процесс на сокете."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(SERVE_CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
 def interactive_mode(
     openai_api_key: Optional[str] = None,
-    index_name: str = "documents"
+    index_name: str = "documents",
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None
 ):
     """Интерактивный режим поиска."""
-    print("\n" + "=" * 80)
-    print("ИНТЕРАКТИВНЫЙ РЕЖИМ ПОИСКА")
-    print("=" * 80)
-    print("Введите 'exit' или 'quit' для выхода")
-    print("Введите 'help' для справки")
-    print("=" * 80)
-    
-    client = FAISSClient(
-        persist_directory="./faiss_db",
-        index_name=index_name
-    )
+    _write([
+        "\n" + BANNER,
+        "ИНТЕРАКТИВНЫЙ РЕЖИМ ПОИСКА",
+        BANNER,
+        "Введите 'exit' или 'quit' для выхода",
+        "Введите 'help' для справки",
+        BANNER,
+    ])
     
-    if not client.load_index():
+    # Клиент и индекс загружаются один раз на весь сеанс
+    client, stats = _build_client(index_name, ef_search, nprobe)
+    if client is None:
         print("❌ Индекс не найден! Сначала запустите ingest.py")
         return
     
-    stats = client.get_index_stats()
     print(f"\n📊 Документов в индексе: {stats['document_count']}")
     
-    while True:
-        try:
-            query = input("\n🔍 Введите запрос: ").strip()
-            
-            if not query:
-                continue
+    # Кэш сохраняется в файл при выходе из интерпретатора
+    query_cache = open_query_cache(client, index_name)
+    _interactive_loop(client, query_cache, openai_api_key)
+
+
+def _print_cache_stats(client: "FAISSClient", query_cache: "SemanticQueryCache"):
+    """Печатает статистику кэшей запросов."""
+    info = client.query_cache_info()
+    print(f"\n🗄️ Кэш эмбеддингов запросов: {info.hits} попаданий, "
+          f"{info.misses} промахов, {info.currsize} записей")
+    print(f"🗄️ Кэш результатов: {query_cache.hits} попаданий, "
+          f"{query_cache.misses} промахов, {query_cache.size} записей")
+
+
+def _search_page(
+    client: "FAISSClient",
+    query: str,
+    n_results: int,
+    openai_api_key: Optional[str] = None
+) -> dict:
+    """Ищет первые n_results результатов запроса (выполняется в фоновом потоке)."""
+    query_embedding = client.embed_query(query, openai_api_key)
+    return client.search(n_results=n_results, query_embedding=query_embedding)
+
+
+def _make_prompt():
+    """
+    Возвращает функцию чтения запроса.
+    
+    С prompt_toolkit у ввода есть история между запусками (стрелка вверх,
+    Ctrl+R): повторный запрос вводится без набора и обслуживается кэшем
+    результатов без обращения к OpenAI.
+    """
+    if not sys.stdin.isatty():
+        return input
+    # prompt_toolkit необязателен: без него запросы читаются обычным input()
+    try:
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.history import FileHistory
+    except ImportError:
+        return input
+    session = PromptSession(history=FileHistory(HISTORY_PATH))
+    return session.prompt
+
+
+def _interactive_loop(
+    client: "FAISSClient",
+    query_cache: "SemanticQueryCache",
+    openai_api_key: Optional[str] = None
+):
+    """
+    Цикл чтения запросов интерактивного режима.
+    
+    Пока пользователь читает результаты, следующая страница для команды
+    'more' ищется в фоновом потоке. Эмбеддинг запроса уже в кэше клиента,
+    поэтому фоновый поиск обычно не обращается к OpenAI.
+    """
+    read_query = _make_prompt()
+    last_query = None
+    shown = 0
+    prefetch = None
+    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        while True:
+            try:
+                query = read_query("\n🔍 Введите запрос: ").strip()
+                
+                if not query:
+                    continue
+                
+                command = query.lower()
+                if command in _EXIT:
+                    print("\n👋 До свидания!")
+                    break
+                
+                if command == _HELP:
+                    _write([
+                        "\n📖 Справка:",
+                        "  - Просто введите ваш вопрос на естественном языке",
+                        "  - Примеры: 'Что такое RAG?', 'корпоративная культура'",
+                        "  - 'more' - следующие результаты по последнему запросу",
+                        "  - 'exit' или 'quit' - выход из программы",
+                    ])
+                    _print_cache_stats(client, query_cache)
+                    continue
+                
+                if command == _MORE:
+                    if last_query is None:
+                        print("\n❌ Сначала введите запрос")
+                        continue
+                    # Фоновый поиск забирается до чтения результата: его
+                    # ошибка не должна повторяться на каждой команде 'more'
+                    future, prefetch = prefetch, None
+                    try:
+                        results = future.result() if future is not None else None
+                    except Exception:
+                        results = None
+                    if results is None:
+                        # Фоновый поиск не удался (сеть, OpenAI) - ищем
+                        # синхронно; ошибка повтора выводится как обычно
+                        results = _search_page(
+                            client, last_query,
+                            shown + INTERACTIVE_PAGE_SIZE, openai_api_key
+                        )
+                    if shown >= len(results['documents'][0]):
+                        print("\n❌ Больше результатов нет")
+                        continue
+                    display_results(results, last_query, start=shown)
+                    shown = len(results['documents'][0])
+                    prefetch = executor.submit(
+                        _search_page, client, last_query,
+                        shown + INTERACTIVE_PAGE_SIZE, openai_api_key
+                    )
+                    continue
+                
+                # Клиент не используется из двух потоков сразу: дожидаемся
+                # фонового поиска (его ошибки здесь не важны)
+                if prefetch is not None:
+                    wait([prefetch])
+                    prefetch = None
+                
+                _execute_search(
+                    client,
+                    query_cache,
+                    query,
+                    n_results=INTERACTIVE_PAGE_SIZE,
+                    openai_api_key=openai_api_key
+                )
+                
+                last_query = query
+                shown = INTERACTIVE_PAGE_SIZE
+                prefetch = executor.submit(
+                    _search_page, client, query,
+                    2 * INTERACTIVE_PAGE_SIZE, openai_api_key
+                )
             
-            if query.lower() in ['exit', 'quit', 'q']:
-                print("\n👋 До свидания!")
+            except KeyboardInterrupt:
+                print("\n\n👋 Прервано пользователем. До свидания!")
                 break
-            
-            if query.lower() == 'help':
-                print("\n📖 Справка:")
-                print("  - Просто введите ваш вопрос на естественном языке")
-                print("  - Примеры: 'Что такое RAG?', 'корпоративная культура'")
-                print("  - 'exit' или 'quit' - выход из программы")
+            except Exception as e:
+                print(f"\n❌ Ошибка: {str(e)}")
                 continue
-            
-            results = client.search(
-                query=query,
-                n_results=3,
-                openai_api_key=openai_api_key
+
+
+def _available_cpus() -> int:
+    """Число CPU, на которых процессу разрешено выполняться."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _parse_cpulist(text: str) -> set:
+    """Разбирает список CPU в формате Linux ("0-3,8,10-11") в множество номеров."""
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _first_numa_node_cpus() -> Optional[set]:
+    """
+    Возвращает доступные процессу CPU первого узла NUMA.
+    
+    Returns:
+        Множество номеров CPU или None, если узел NUMA один
+        (или система не сообщает о них)
+    """
+    try:
+        with os.scandir(_NUMA_NODES_DIR) as entries:
+            nodes = sorted(
+                int(entry.name[4:]) for entry in entries
+                if entry.name.startswith('node') and entry.name[4:].isdigit()
             )
-            display_results(results, query)
-            
-        except KeyboardInterrupt:
-            print("\n\n👋 Прервано пользователем. До свидания!")
-            break
-        except Exception as e:
-            print(f"\n❌ Ошибка: {str(e)}")
+    except OSError:
+        return None
+    if len(nodes) < 2:
+        return None
+    
+    allowed = os.sched_getaffinity(0)
+    for node in nodes:
+        try:
+            with open(f"{_NUMA_NODES_DIR}/node{node}/cpulist") as f:
+                cpus = _parse_cpulist(f.read()) & allowed
+        except OSError:
             continue
+        if cpus:
+            return cpus
+    return None
 
 
-def main():
-    """Основная функция скрипта."""
-    parser = argparse.ArgumentParser(
+def _apply_cpu_affinity(spec: str):
+    """
+    Привязывает процесс к набору CPU до загрузки faiss.
+    
+    Полный перебор упирается в пропускную способность памяти: потоки
+    на другом сокете читают векторы через межсокетную шину и не ускоряют
+    поиск. Поэтому на машине с несколькими узлами NUMA процесс по умолчанию
+    работает на CPU одного узла, а потоки OpenMP закрепляются за ядрами.
+    
+    Args:
+        spec: 'auto' - один узел NUMA, если их несколько; 'none' - без
+              привязки; иначе список CPU в формате Linux, например "0-7"
+    """
+    global SEARCH_THREADS
+    if spec == 'none' or not hasattr(os, 'sched_setaffinity'):
+        return
+    
+    try:
+        cpus = _first_numa_node_cpus() if spec == 'auto' else _parse_cpulist(spec)
+        if not cpus:
+            return
+        os.sched_setaffinity(0, cpus)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Не удалось привязать процесс к CPU ({spec}): {str(e)}")
+        return
+    
+    # Настройки OpenMP читаются при загрузке faiss, поэтому задаются здесь
+    os.environ.setdefault("OMP_PROC_BIND", "close")
+    os.environ.setdefault("OMP_PLACES", "cores")
+    if "FAISS_THREADS" not in os.environ:
+        SEARCH_THREADS = min(SEARCH_THREADS, len(cpus))
+
+
+# Парсер аргументов строится один раз, при первом обращении
+_PARSER = None
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    """Возвращает парсер аргументов командной строки (создается один раз)."""
+    global _PARSER
+    if _PARSER is not None:
+        return _PARSER
+    
+    _PARSER = parser = argparse.ArgumentParser(
         description="Поиск по документам в FAISS",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
@@ -169,6 +822,8 @@ def main():
   python search.py "удаленная работа" --n-results 3
   python search.py "инструменты разработки" --filter-type txt
   python search.py --interactive
+  python search.py --batch-file queries.txt
+  python search.py --serve
         """
     )
     
@@ -182,6 +837,16 @@ def main():
         action='store_true',
         help='Запустить в интерактивном режиме'
     )
+    parser.add_argument(
+        '--batch-file', '--queries',
+        type=str,
+        help='Файл с запросами (по одному на строку) для пакетного поиска'
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Запустить фоновый процесс поиска с загруженным индексом'
+    )
     parser.add_argument(
         '--n-results', '-n',
         type=int,
@@ -204,13 +869,74 @@ def main():
         choices=['txt', 'html'],
         help='Фильтровать результаты по типу документа'
     )
+    parser.add_argument(
+        '--ef-search',
+        type=int,
+        default=None,
+        help='Размер очереди кандидатов HNSW: больше - точнее, но медленнее '
+             '(по умолчанию: значение клиента FAISS)'
+    )
+    parser.add_argument(
+        '--nprobe',
+        type=int,
+        default=None,
+        help='Количество просматриваемых кластеров IVF: больше - точнее, '
+             'но медленнее (по умолчанию: значение клиента FAISS)'
+    )
+    parser.add_argument(
+        '--gpu',
+        action='store_true',
+        help='Искать на GPU при любом размере индекса '
+             '(без faiss-gpu и CUDA поиск остается на CPU)'
+    )
+    parser.add_argument(
+        '--cpu-affinity',
+        type=str,
+        default='auto',
+        help='CPU для поиска: auto - один узел NUMA, если их несколько; '
+             'none - без привязки; или список вида 0-7 (по умолчанию: auto)'
+    )
     
+    return _PARSER
+
+
+def main():
+    """Основная функция скрипта."""
+    parser = _get_parser()
     args = parser.parse_args()
+    _apply_cpu_affinity(args.cpu_affinity)
+    
+    if args.serve:
+        serve(
+            openai_api_key=args.openai_key,
+            index_name=args.index,
+            ef_search=args.ef_search,
+            nprobe=args.nprobe,
+            gpu=args.gpu
+        )
+        return
     
     if args.interactive:
         interactive_mode(
             openai_api_key=args.openai_key,
-            index_name=args.index
+            index_name=args.index,
+            ef_search=args.ef_search,
+            nprobe=args.nprobe
+        )
+        return
+    
+    if args.batch_file:
+        if args.query:
+            parser.error("укажите либо запрос, либо --batch-file/--queries")
+        search_batch_file(
+            batch_file=args.batch_file,
+            n_results=args.n_results,
+            openai_api_key=args.openai_key,
+            index_name=args.index,
+            filter_type=args.filter_type,
+            ef_search=args.ef_search,
+            nprobe=args.nprobe,
+            gpu=args.gpu
         )
         return
     
@@ -224,7 +950,10 @@ def main():
         n_results=args.n_results,
         openai_api_key=args.openai_key,
         index_name=args.index,
-        filter_type=args.filter_type
+        filter_type=args.filter_type,
+        ef_search=args.ef_search,
+        nprobe=args.nprobe,
+        gpu=args.gpu
     )
 
 
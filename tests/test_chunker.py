@@ -0,0 +1,40 @@
+"""
+Тесты разбиения текста на чанки.
+"""
+
+import random
+import unittest
+
+from loader.chunker import chunk_text_smart
+
+
+class ChunkTextSmartTest(unittest.TestCase):
+    
+    def setUp(self):
+        rng = random.Random(1)
+        self.words = [f"слово{i}" for i in range(3000)]
+        self.text = ' '.join(
+            word + rng.choice(['', '', '.', ',', '\n']) for word in self.words
+        )
+    
+    def test_chunks_start_on_word_boundary(self):
+        words = set(self.words)
+        for chunk_size, overlap in [(500, 100), (200, 150), (50, 49), (30, 10), (1000, 0)]:
+            with self.subTest(chunk_size=chunk_size, overlap=overlap):
+                chunks = chunk_text_smart(self.text, chunk_size, overlap)
+                for chunk in chunks:
+                    self.assertIn(chunk.split()[0].rstrip('.,'), words)
+                    self.assertLessEqual(len(chunk), chunk_size)
+    
+    def test_text_without_separators_terminates(self):
+        chunks = chunk_text_smart("x" * 100, chunk_size=10, overlap=9)
+        self.assertTrue(all(len(chunk) == 10 for chunk in chunks))
+        self.assertEqual(len(chunks), 91)
+    
+    def test_overlap_must_be_less_than_chunk_size(self):
+        with self.assertRaises(ValueError):
+            chunk_text_smart(self.text, chunk_size=100, overlap=100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+Тесты удаления и замены документов в FAISSClient для всех типов индексов.
+
+Эмбеддинги передаются напрямую, поэтому OpenAI API не нужен.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import faiss
+import numpy as np
+
+from faiss_store.faiss_client import FAISSClient, INDEX_TYPES
+
+
+N_DOCS = 1200
+DIM = 32
+
+
+def _random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, DIM)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class DeleteAndReplaceTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vectors = _random_vectors(N_DOCS)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def _build(self, **kwargs) -> FAISSClient:
+        client = FAISSClient(
+            self.directory, embedding_dim=DIM, tail_size=300,
+            use_embedding_cache=False, use_gpu=False, **kwargs
+        )
+        client.add_documents(
+            [f"text {i}" for i in range(N_DOCS)],
+            [{'i': i} for i in range(N_DOCS)],
+            [f"id{i}" for i in range(N_DOCS)],
+            embeddings=self.vectors
+        )
+        # Перечитываем с диска, чтобы удаление шло из основного индекса
+        client = FAISSClient(
+            self.directory, embedding_dim=DIM,
+            use_embedding_cache=False, use_gpu=False
+        )
+        client.load_index()
+        return client
+    
+    def _top1(self, client: FAISSClient, vector: np.ndarray) -> int:
+        result = client.search(query_embedding=vector, n_results=1)
+        return result['metadatas'][0][0]['i']
+    
+    def _misses(self, client: FAISSClient, positions) -> int:
+        return sum(self._top1(client, self.vectors[i]) != i for i in positions)
+    
+    def _check_delete_and_replace(self, client: FAISSClient):
+        probe = range(20, N_DOCS, 37)
+        # Квантованные индексы (PQ) неточны и без удаления, поэтому
+        # сравниваем с числом промахов до удаления
+        baseline = self._misses(client, probe)
+        
+        client.delete_documents(["id3"])
+        self.assertNotEqual(self._top1(client, self.vectors[3]), 3)
+        self.assertLessEqual(self._misses(client, probe), baseline)
+        
+        client.add_documents(
+            ["replaced"], [{'i': 5005}], ["id5"], embeddings=-self.vectors[5:6]
+        )
+        client.delete_documents(["id10"])
+        self.assertEqual(self._top1(client, -self.vectors[5]), 5005)
+        self.assertLessEqual(self._misses(client, probe), baseline)
+        stats = client.get_index_stats()
+        self.assertEqual(stats['document_count'], N_DOCS - 2)
+        self.assertEqual(stats['vector_count'], N_DOCS - 2)
+    
+    def test_index_types(self):
+        for index_type in INDEX_TYPES:
+            with self.subTest(index_type=index_type):
+                shutil.rmtree(self.directory, ignore_errors=True)
+                self._check_delete_and_replace(self._build(index_type=index_type))
+    
+    def test_ivf_factory(self):
+        client = self._build(index_factory="IVF64,Flat")
+        self._check_delete_and_replace(client)
+    
+    def test_legacy_idmap_over_ivf(self):
+        # Раньше IVF-индексы сохранялись в обертке IndexIDMap2
+        client = self._build(index_type='ivfsq8')
+        client._ensure_writable()
+        client._merge_tail()
+        ivf = client._build_index(DIM, n_train=N_DOCS)
+        ivf.train(self.vectors)
+        legacy = faiss.IndexIDMap2(ivf)
+        legacy.add_with_ids(
+            self.vectors,
+            np.array([client._to_int_id(f"id{i}") for i in range(N_DOCS)])
+        )
+        client.index = legacy
+        client.save_index()
+        
+        client = FAISSClient(
+            self.directory, use_embedding_cache=False, use_gpu=False
+        )
+        client.load_index()
+        self.assertIsInstance(client.index, faiss.IndexIDMap2)
+        self._check_delete_and_replace(client)
+        self.assertNotIsInstance(client.index, faiss.IndexIDMap2)
+
+
+
+class RecreateIndexTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vectors = _random_vectors(104)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def _add(self, client: FAISSClient, prefix: str, n: int):
+        client.add_documents(
+            [f"text {i}" for i in range(n)],
+            [{'i': i} for i in range(n)],
+            [f"{prefix}{i}" for i in range(n)],
+            embeddings=self.vectors[:n]
+        )
+    
+    def test_flat_over_hnsw_ignores_old_tail(self):
+        client = FAISSClient(
+            self.directory, index_type='hnsw', embedding_dim=DIM,
+            use_embedding_cache=False, use_gpu=False
+        )
+        self._add(client, "old", 104)
+        
+        client = FAISSClient(
+            self.directory, index_type='flat', embedding_dim=DIM,
+            use_embedding_cache=False, use_gpu=False
+        )
+        client.create_index(DIM)
+        self._add(client, "new", 13)
+        
+        client = FAISSClient(
+            self.directory, use_embedding_cache=False, use_gpu=False
+        )
+        client.load_index()
+        self.assertEqual(client.get_index_stats()['vector_count'], 13)
+        result = client.search(query_embedding=self.vectors[0], n_results=3)
+        self.assertEqual(len(result['documents'][0]), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()